@@ -3,8 +3,9 @@ FILE: ai.py
 ROLE: The AI layer. All OpenAI API calls and RAG logic live here.
 
 WHAT THIS FILE DOES:
-- Splits documents into overlapping chunks (semantic-aware)
+- Splits documents into overlapping chunks (semantic-aware, token-sized)
 - Creates embeddings using OpenAI text-embedding-3-small (1536 dimensions)
+- Calls OpenAI through AsyncOpenAI so requests never block the event loop
 - Performs semantic search to find relevant chunks
 - Re-ranks retrieved chunks by relevance score before sending to GPT
 - Sends context + question + history to GPT-4o-mini
@@ -18,22 +19,34 @@ KEY CONCEPTS:
 - Re-ranking: score retrieved chunks against query, drop low-relevance ones
 """
 
-from openai import OpenAI
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from database import DocumentChunk, Message
+from openai import AsyncOpenAI
+from pgvector import HalfVector
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text, any_
+from database import ChunkBlob, Message
+import database
 from dotenv import load_dotenv
-import uuid
+from typing import AsyncIterator, Iterator
+import asyncio
+import tiktoken
+import numpy as np
+import functools
+import hashlib
 import re
 import os
-import math
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Async client — awaiting it frees the event loop during OpenAI round-trips
+aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 EMBEDDING_MODEL = "text-embedding-3-small"   # 1536 dimensions
+EMBEDDING_DIMENSIONS = 1536
 CHAT_MODEL = "gpt-4o-mini"                   # fast and cheap
+EMBEDDING_BATCH_SIZE = 96                    # chunks per embeddings request
+EMBEDDING_MAX_CONCURRENCY = 5                # embeddings requests in flight at once
+EMBEDDING_MAX_RETRIES = 5                    # SDK retries 429/5xx with jittered backoff
+HNSW_EF_SEARCH = 100                         # HNSW candidate list size (recall vs speed)
 
 
 # ─────────────────────────────────────────
@@ -45,126 +58,320 @@ CHAT_MODEL = "gpt-4o-mini"                   # fast and cheap
 # New approach:
 # 1. Split on paragraph boundaries first (double newline)
 # 2. If a paragraph is too long, split on sentence boundaries
-# 3. Group small paragraphs together up to chunk_size words
-# 4. Overlap by carrying the last `overlap` words of previous chunk
+# 3. Group small paragraphs together up to chunk_size tokens
+# 4. Overlap by carrying the last `overlap` tokens of previous chunk
+#
+# Sizes are counted in cl100k_base tokens — the tokenizer the
+# embedding model uses — not words. A 400-word chunk can be
+# anywhere from 300 to 900 tokens; a 512-token chunk is 512
+# tokens, so every embedding carries about the same amount of text.
 #
 # Result: chunks respect natural document structure.
 # ─────────────────────────────────────────
 
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+(?=[A-Z])')
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+@functools.cache
+def get_encoding() -> tiktoken.Encoding:
+    """The text-embedding-3-* tokenizer, loaded on first use.
+
+    Loading may download the BPE file, so it stays out of import time.
+    """
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def starts_mid_character(token: int) -> bool:
+    """True if the token's bytes continue a UTF-8 character begun by the token before it."""
+    # cl100k splits many CJK characters and emoji across tokens
+    return get_encoding().decode_single_token_bytes(token)[0] & 0xC0 == 0x80
+
+
+def split_tokens(tokens: list[int], size: int) -> Iterator[list[int]]:
+    """Cut tokens into pieces of at most size, never inside a character."""
+    start = 0
+    while start < len(tokens):
+        end = min(start + size, len(tokens))
+        while start + 1 < end < len(tokens) and starts_mid_character(tokens[end]):
+            end -= 1
+        yield tokens[start:end]
+        start = end
+
+
 def split_into_sentences(text: str) -> list[str]:
     """Split text into sentences using punctuation boundaries."""
-    sentences = re.split(r'(?<=[.!?])\s+(?=[A-Z])', text.strip())
+    sentences = _SENTENCE_BREAK.split(text.strip())
     return [s.strip() for s in sentences if s.strip()]
 
 
-def chunk_text(content: str, chunk_size: int = 400, overlap: int = 50) -> list[str]:
+def encode_unit(text: str) -> list[int]:
+    """Tokens for one paragraph/sentence, whitespace collapsed, with a leading space."""
+    # encode_ordinary: document text is never parsed for special tokens
+    return get_encoding().encode_ordinary(" " + " ".join(text.split()))
+
+
+def chunk_text(content: str, chunk_size: int = 512, overlap: int = 64) -> Iterator[str]:
     """
-    Semantic-aware chunking:
+    Semantic-aware chunking (generator — wrap in list() if you need len):
     1. Split on paragraphs first
     2. Split long paragraphs on sentences
-    3. Group into chunks up to chunk_size words
-    4. Add sentence-level overlap between chunks
+    3. Group into chunks up to chunk_size tokens
+    4. Add token-level overlap between chunks
+    Each unit is tokenized once; each chunk is decoded once.
     """
     # Step 1 — Split into paragraphs
-    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', content) if p.strip()]
+    paragraphs = [p.strip() for p in _PARAGRAPH_BREAK.split(content) if p.strip()]
 
     if not paragraphs:
-        return [content]
+        yield content
+        return
 
-    # Step 2 — Break long paragraphs into sentences
-    units = []
-    for para in paragraphs:
-        word_count = len(para.split())
-        if word_count > chunk_size:
-            sentences = split_into_sentences(para)
-            units.extend(sentences)
-        else:
-            units.append(para)
-
-    # Step 3 — Group units into chunks up to chunk_size words
-    chunks = []
-    current_words = []
-    current_count = 0
-
-    for unit in units:
-        unit_words = unit.split()
-        unit_count = len(unit_words)
-
-        if current_count + unit_count > chunk_size and current_words:
-            chunks.append(" ".join(current_words))
-            # Step 4 — Overlap: carry last `overlap` words into next chunk
-            overlap_words = current_words[-overlap:] if len(current_words) > overlap else current_words
-            current_words = overlap_words + unit_words
-            current_count = len(current_words)
-        else:
-            current_words.extend(unit_words)
-            current_count += unit_count
+    current_tokens = []
+    # A single sentence longer than a chunk is cut on token boundaries,
+    # leaving room for the overlap carried in front of it
+    max_piece = chunk_size - overlap
+    encoding = get_encoding()
 
-    if current_words:
-        chunks.append(" ".join(current_words))
+    for para in paragraphs:
+        para_tokens = encode_unit(para)
 
-    return chunks if chunks else [content]
+        # Step 2 — Break long paragraphs into sentences
+        if len(para_tokens) > chunk_size:
+            units = (encode_unit(sentence) for sentence in split_into_sentences(para))
+        else:
+            units = (para_tokens,)
+
+        # Step 3 — Group units into chunks up to chunk_size tokens
+        for unit_tokens in units:
+            for piece in split_tokens(unit_tokens, max_piece):
+                if len(current_tokens) + len(piece) > chunk_size and current_tokens:
+                    yield encoding.decode(current_tokens).strip()
+                    # Step 4 — Overlap: carry last `overlap` tokens into next chunk,
+                    # starting on a whole character
+                    carried = current_tokens[-overlap:]
+                    skip = 0
+                    while skip < len(carried) and starts_mid_character(carried[skip]):
+                        skip += 1
+                    current_tokens = carried[skip:] + piece
+                else:
+                    current_tokens.extend(piece)
+
+    if current_tokens:
+        yield encoding.decode(current_tokens).strip()
 
 
 # ─────────────────────────────────────────
 # EMBEDDING
 # ─────────────────────────────────────────
 
-def get_embedding(text: str) -> list[float]:
-    response = client.embeddings.create(
+async def get_embedding(text: str) -> list[float]:
+    response = await aclient.embeddings.create(
         model=EMBEDDING_MODEL,
         input=text.replace("\n", " ")
     )
     return response.data[0].embedding
 
 
+async def get_embeddings_batch(texts: list[str]) -> list[list[float]]:
+    """Embed many texts in one API call. Output order matches input order."""
+    # The SDK honours Retry-After and backs off with jitter between retries
+    response = await aclient.with_options(max_retries=EMBEDDING_MAX_RETRIES).embeddings.create(
+        model=EMBEDDING_MODEL,
+        input=[t.replace("\n", " ") for t in texts]
+    )
+    return [item.embedding for item in response.data]
+
+
+async def embed_chunks(chunks: list[str]) -> list[list[float]]:
+    """
+    Embed all chunks of a document.
+    Batches are sent concurrently (bounded) so network waits overlap.
+    Results come back in chunk order.
+    """
+    semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENCY)
+
+    async def embed_batch(batch: list[str]) -> list[list[float]]:
+        async with semaphore:
+            return await get_embeddings_batch(batch)
+
+    results = await asyncio.gather(*(
+        embed_batch(chunks[start:start + EMBEDDING_BATCH_SIZE])
+        for start in range(0, len(chunks), EMBEDDING_BATCH_SIZE)
+    ))
+    return [embedding for batch in results for embedding in batch]
+
+
+# ─────────────────────────────────────────
+# CHUNK BLOBS
+# Chunk text is stored once per sha256(content) in chunk_blobs,
+# so identical text is only ever embedded once, across documents
+# and re-processing. Documents just reference blobs by hash.
+#
+# Blobs are shared, so reuse and pruning lock them: a blob found by
+# lookup_blobs is KEY SHARE locked until the new references commit,
+# and prune_orphan_blobs skips locked blobs and re-checks for
+# references only once it holds its own lock.
+# ─────────────────────────────────────────
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+async def lookup_blobs(hashes: list[str], model: str, db: AsyncSession) -> set:
+    """Returns the hashes that already have a blob embedded with this model.
+
+    The blobs stay KEY SHARE locked until the transaction ends, so a
+    concurrent prune can't delete them before they are referenced.
+    """
+    # = ANY(array) keeps one statement shape for any number of hashes,
+    # so asyncpg reuses its prepared statement (IN would expand per count)
+    result = await db.execute(select(ChunkBlob.id).where(
+        ChunkBlob.id == any_(hashes),
+        ChunkBlob.model == model,
+        ChunkBlob.embedding.isnot(None)
+    ).with_for_update(read=True, key_share=True))
+    return set(result.scalars())
+
+
+async def store_blobs(blobs: dict, model: str, db: AsyncSession) -> None:
+    """Insert new {hash: (content, embedding)} blobs.
+
+    Concurrent duplicates are ignored; a blob left over from another
+    model (or without an embedding) is re-embedded in place.
+    """
+    if not blobs:
+        return
+    # A list of parameter sets runs as asyncpg executemany: one
+    # prepared statement, all rows pipelined in binary format
+    await db.execute(text("""
+        INSERT INTO chunk_blobs (id, content, embedding, model)
+        VALUES (:id, :content, :embedding, :model)
+        ON CONFLICT (id) DO UPDATE
+        SET embedding = EXCLUDED.embedding, model = EXCLUDED.model
+        WHERE chunk_blobs.model IS DISTINCT FROM EXCLUDED.model
+        OR chunk_blobs.embedding IS NULL
+    """), [
+        {
+            "id": h,
+            "content": content,
+            "embedding": HalfVector(embedding),
+            "model": model,
+        }
+        for h, (content, embedding) in blobs.items()
+    ])
+
+
+async def store_chunk_blobs(chunks: list[str], db: AsyncSession) -> list[str]:
+    """Make sure every chunk has an embedded blob; returns their hashes in order.
+
+    Only chunks whose text has never been seen are sent to OpenAI.
+    """
+    hashes = [content_hash(c) for c in chunks]
+    existing = await lookup_blobs(hashes, EMBEDDING_MODEL, db)
+
+    # dict also collapses duplicate chunks within this document
+    missing = {h: c for h, c in zip(hashes, chunks) if h not in existing}
+    if missing:
+        embeddings = await embed_chunks(list(missing.values()))
+        await store_blobs({
+            h: (content, embedding)
+            for (h, content), embedding in zip(missing.items(), embeddings)
+        }, EMBEDDING_MODEL, db)
+
+    return hashes
+
+
+async def prune_orphan_blobs(blob_ids: list[str], db: AsyncSession) -> None:
+    """Delete blobs no document references any more, so deleted text does not linger."""
+    if not blob_ids:
+        return
+    # Blobs being reused right now are locked — skip them (they are
+    # about to be referenced) rather than wait and risk a deadlock
+    locked = list((await db.execute(text("""
+        SELECT id FROM chunk_blobs
+        WHERE id = ANY(:ids)
+        ORDER BY id
+        FOR UPDATE SKIP LOCKED
+    """), {"ids": list(set(blob_ids))})).scalars())
+    if not locked:
+        return
+    # A separate statement, so its snapshot sees references committed
+    # by anyone who held a blob before we locked it
+    await db.execute(text("""
+        DELETE FROM chunk_blobs b
+        WHERE b.id = ANY(:ids)
+        AND NOT EXISTS (SELECT 1 FROM document_chunks c WHERE c.blob_id = b.id)
+    """), {"ids": locked})
+
+
+async def delete_document_chunks(document_id: str, db: AsyncSession) -> list[str]:
+    """Delete a document's chunk references; returns the blob ids they pointed at."""
+    return list((await db.execute(text("""
+        DELETE FROM document_chunks
+        WHERE document_id = :document_id
+        RETURNING blob_id
+    """), {"document_id": document_id})).scalars())
+
+
 # ─────────────────────────────────────────
 # COSINE SIMILARITY
 # Used for re-ranking: measures how similar two vectors are.
-# Returns a float between -1 and 1 (higher = more similar).
+# Returns floats between -1 and 1 (higher = more similar).
+#
+# All candidates are scored at once: one (K, 1536) @ (1536,)
+# matrix-vector product that NumPy hands to BLAS, instead of a
+# Python loop per vector. Rows are re-normalized here because
+# fp16 storage leaves OpenAI's unit vectors slightly off-length.
 # ─────────────────────────────────────────
 
-def cosine_similarity(vec_a: list[float], vec_b: list[float]) -> float:
-    dot = sum(a * b for a, b in zip(vec_a, vec_b))
-    mag_a = math.sqrt(sum(a * a for a in vec_a))
-    mag_b = math.sqrt(sum(b * b for b in vec_b))
-    if mag_a == 0 or mag_b == 0:
-        return 0.0
-    return dot / (mag_a * mag_b)
+def cosine_similarities(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every row in matrix (K, D) against query (D,)."""
+    row_norms = np.linalg.norm(matrix, axis=1)
+    query_norm = np.linalg.norm(query)
+    denom = row_norms * query_norm
+    dots = matrix @ query
+    # Zero vectors score 0 instead of dividing by zero
+    return np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
 
 
 # ─────────────────────────────────────────
 # PROCESS DOCUMENT
 # ─────────────────────────────────────────
 
-def process_document(
+async def process_document(
     document_id: str,
     user_id: str,
     content: str,
-    db: Session
+    db: AsyncSession
 ) -> int:
-    # Clean up existing chunks
-    db.query(DocumentChunk).filter(
-        DocumentChunk.document_id == document_id
-    ).delete()
-    db.commit()
+    """Replace a document's chunks in one transaction; the caller commits.
 
-    chunks = chunk_text(content)
+    The document is never seen with no chunks, and the blobs it reuses
+    are locked against concurrent prunes until the commit.
+    """
+    # Clean up existing chunks; their blobs stay until the new
+    # chunks are in, so unchanged text is not re-embedded
+    old_blob_ids = await delete_document_chunks(document_id, db)
 
-    for i, chunk_content in enumerate(chunks):
-        embedding = get_embedding(chunk_content)
+    chunks = list(chunk_text(content))
 
-        chunk = DocumentChunk(
-            id=str(uuid.uuid4()),
-            document_id=document_id,
-            user_id=user_id,
-            content=chunk_content,
-            chunk_index=i,
-            embedding=embedding
-        )
-        db.add(chunk)
+    blob_ids = await store_chunk_blobs(chunks, db)
 
-    db.commit()
+    # Raw executemany skips the ORM unit-of-work and SQL compilation
+    await db.execute(text("""
+        INSERT INTO document_chunks (document_id, user_id, blob_id, chunk_index)
+        VALUES (:document_id, :user_id, :blob_id, :chunk_index)
+    """), [
+        {
+            "document_id": document_id,
+            "user_id": user_id,
+            "blob_id": blob_id,
+            "chunk_index": i,
+        }
+        for i, blob_id in enumerate(blob_ids)
+    ])
+    await prune_orphan_blobs(old_blob_ids, db)
     return len(chunks)
 
 
@@ -172,7 +379,7 @@ def process_document(
 # SEMANTIC SEARCH + RE-RANKING
 #
 # Step 1: fetch 2x candidates from pgvector
-# Step 2: re-score each with cosine similarity
+# Step 2: re-score all of them with one vectorized cosine pass
 # Step 3: sort by score, filter below MIN_SCORE
 # Step 4: return top `limit` chunks
 #
@@ -181,76 +388,94 @@ def process_document(
 # cosine similarity improves result quality.
 # ─────────────────────────────────────────
 
-def find_relevant_chunks(
-    question: str,
+async def search_chunks(
+    question_embedding: list[float],
     user_id: str,
     document_id: str,
-    db: Session,
+    db: AsyncSession,
     limit: int = 5
 ) -> list[str]:
-    question_embedding = get_embedding(question)
-
+    """Vector search + re-rank within one document for an already-embedded question."""
     # Fetch more candidates than needed for re-ranking
     fetch_limit = limit * 2
 
-    results = db.execute(text("""
-        SELECT content, embedding
-        FROM document_chunks
-        WHERE user_id = :user_id
-        AND document_id = :document_id
-        ORDER BY embedding <=> CAST(:embedding AS vector)
+    # Widen the HNSW search for this transaction only
+    await db.execute(text(f"SET LOCAL hnsw.ef_search = {HNSW_EF_SEARCH}"))
+    if database.HNSW_ITERATIVE_SCAN:
+        # relaxed_order is fine — candidates are re-ranked below
+        await db.execute(text("SET LOCAL hnsw.iterative_scan = relaxed_order"))
+
+    results = (await db.execute(text("""
+        SELECT b.content, b.embedding
+        FROM document_chunks c
+        JOIN chunk_blobs b ON b.id = c.blob_id
+        WHERE c.user_id = :user_id
+        AND c.document_id = :document_id
+        ORDER BY b.embedding <=> :embedding
         LIMIT :limit
     """), {
         "user_id": user_id,
         "document_id": document_id,
-        "embedding": str(question_embedding),
+        "embedding": HalfVector(question_embedding),   # fp16, matches the column
         "limit": fetch_limit
-    }).fetchall()
+    })).fetchall()
 
     if not results:
         return []
 
-    # Re-rank by exact cosine similarity
-    scored = []
-    for row in results:
-        content = row[0]
-        chunk_embedding_str = row[1]
-        try:
-            chunk_embedding = [float(x) for x in chunk_embedding_str.strip("[]").split(",")]
-            score = cosine_similarity(question_embedding, chunk_embedding)
-        except Exception:
-            score = 0.0
-        scored.append((content, score))
+    # Re-rank by exact cosine similarity (fp32)
+    contents = [row[0] for row in results]
+    matrix = np.stack([
+        row[1].to_numpy() if row[1] is not None else np.zeros(EMBEDDING_DIMENSIONS)
+        for row in results
+    ]).astype(np.float32)
+    scores = cosine_similarities(matrix, np.asarray(question_embedding, dtype=np.float32))
 
-    scored.sort(key=lambda x: x[1], reverse=True)
+    # Top `limit` by score, best first
+    top = np.argpartition(-scores, limit - 1)[:limit] if len(scores) > limit else np.arange(len(scores))
+    top = top[np.argsort(-scores[top])]
+    scored = [(contents[i], float(scores[i])) for i in top]
 
     # Filter out low relevance chunks
     MIN_SCORE = 0.3
-    top_chunks = [content for content, score in scored[:limit] if score >= MIN_SCORE]
+    top_chunks = [content for content, score in scored if score >= MIN_SCORE]
 
     # Fallback: if filtering removed everything, return top results unfiltered
     if not top_chunks:
-        top_chunks = [content for content, _ in scored[:limit]]
+        top_chunks = [content for content, _ in scored]
 
     return top_chunks
 
 
+async def find_relevant_chunks(
+    question: str,
+    user_id: str,
+    document_id: str,
+    db: AsyncSession,
+    limit: int = 5
+) -> list[str]:
+    question_embedding = await get_embedding(question)
+    return await search_chunks(question_embedding, user_id, document_id, db, limit)
+
+
 # ─────────────────────────────────────────
 # MULTI-DOC SEARCH
+# The question is embedded once and reused for every document.
 # ─────────────────────────────────────────
 
-def find_relevant_chunks_multi(
+async def find_relevant_chunks_multi(
     question: str,
     user_id: str,
     document_ids: list[str],
-    db: Session,
+    db: AsyncSession,
     limit_per_doc: int = 3
 ) -> list[str]:
     """Find relevant chunks across multiple documents."""
+    question_embedding = await get_embedding(question)
     all_chunks = []
     for document_id in document_ids:
-        chunks = find_relevant_chunks(
-            question=question,
+        chunks = await search_chunks(
+            question_embedding=question_embedding,
             user_id=user_id,
             document_id=document_id,
             db=db,
@@ -264,25 +489,29 @@ def find_relevant_chunks_multi(
 # CONVERSATION HISTORY HELPER
 # ─────────────────────────────────────────
 
-def get_conversation_history(conversation_id: str, db: Session) -> list:
-    """Returns last 10 messages in chronological order."""
-    return db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(
-        Message.created_at.asc()
-    ).limit(10).all()
+async def get_conversation_history(conversation_id: str, db: AsyncSession) -> list:
+    """Returns last 10 messages (role, content) in chronological order."""
+    # Newest-first so Postgres reads 10 index entries and stops,
+    # then flip back to chronological order for the prompt
+    rows = (await db.execute(
+        select(Message.role, Message.content).where(
+            Message.conversation_id == conversation_id
+        ).order_by(
+            Message.created_at.desc()
+        ).limit(10)
+    )).all()
+    rows.reverse()
+    return rows
 
 
 # ─────────────────────────────────────────
 # BUILD MESSAGES HELPER
 # Shared prompt structure for regular + streaming
+# The instructions never change, so they are built once at import;
+# per request only the retrieved context is appended.
 # ─────────────────────────────────────────
 
-def build_messages(context: str, history: list, question: str) -> list:
-    messages = [
-        {
-            "role": "system",
-            "content": f"""You are a helpful document assistant for DocMind.
+SYSTEM_PROMPT = """You are a helpful document assistant for DocMind.
 Answer questions about the document provided.
 
 RULES:
@@ -293,27 +522,29 @@ RULES:
 - Quote relevant parts when helpful
 
 DOCUMENT CONTEXT:
-{context}"""
-        }
+"""
+
+
+def build_messages(context: str, history: list, question: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT + context},
+        *({"role": msg.role, "content": msg.content} for msg in history),
+        {"role": "user", "content": question},
     ]
-    for msg in history:
-        messages.append({"role": msg.role, "content": msg.content})
-    messages.append({"role": "user", "content": question})
-    return messages
 
 
 # ─────────────────────────────────────────
 # GENERATE RAG RESPONSE (non-streaming)
 # ─────────────────────────────────────────
 
-def generate_rag_response(
+async def generate_rag_response(
     question: str,
     document_id: str,
     user_id: str,
     conversation_id: str,
-    db: Session
+    db: AsyncSession
 ) -> str:
-    relevant_chunks = find_relevant_chunks(
+    relevant_chunks = await find_relevant_chunks(
         question=question,
         user_id=user_id,
         document_id=document_id,
@@ -324,10 +555,10 @@ def generate_rag_response(
         return "I couldn't find relevant information in this document to answer your question."
 
     context = "\n\n---\n\n".join(relevant_chunks)
-    history = get_conversation_history(conversation_id, db)
+    history = await get_conversation_history(conversation_id, db)
     messages = build_messages(context, history, question)
 
-    response = client.chat.completions.create(
+    response = await aclient.chat.completions.create(
         model=CHAT_MODEL,
         messages=messages,
         max_tokens=1000,
@@ -337,11 +568,31 @@ def generate_rag_response(
     return response.choices[0].message.content
 
 
+# ─────────────────────────────────────────
+# STREAM CHAT COMPLETION
+# Yields tokens as OpenAI produces them, so the first words reach
+# the client in a few hundred ms instead of after the full answer.
+# ─────────────────────────────────────────
+
+async def stream_chat_completion(messages: list) -> AsyncIterator[str]:
+    stream = await aclient.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=messages,
+        max_tokens=1000,
+        temperature=0.3,
+        stream=True,
+    )
+    async for event in stream:
+        delta = event.choices[0].delta.content
+        if delta:
+            yield delta
+
+
 # ─────────────────────────────────────────
 # GENERATE SUMMARY
 # ─────────────────────────────────────────
 
-def generate_summary(content: str) -> str:
+async def generate_summary(content: str) -> str:
     """
     Generates a concise 3-sentence summary of the document.
     Called automatically after processing.
@@ -354,7 +605,7 @@ Document:
 
 Summary:"""
 
-    response = client.chat.completions.create(
+    response = await aclient.chat.completions.create(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": prompt}],
         max_tokens=200,
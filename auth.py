@@ -3,8 +3,8 @@ FILE: auth.py
 ROLE: The security layer. Everything about identity and access lives here.
 
 WHAT THIS FILE DOES:
-- Hashes passwords with bcrypt before storing (one-way, irreversible)
-- Verifies passwords at login by comparing hashes
+- Hashes passwords with argon2id before storing (one-way, irreversible)
+- Verifies passwords at login by comparing hashes (argon2id or legacy bcrypt)
 - Creates JWT access tokens (expire in 30 min) and refresh tokens (7 days)
 - Provides get_current_user() which decodes tokens and returns the logged-in user
 
@@ -15,25 +15,35 @@ WHAT THIS FILE DOES NOT DO:
 
 HOW get_current_user() WORKS (used on every protected endpoint):
 1. FastAPI extracts the Bearer token from the request header
-2. We decode the JWT using SECRET_KEY
+2. We decode the JWT using SECRET_KEY (signature checked once per token)
 3. We extract the user_id from the token payload
-4. We look up that user_id in the database
-5. We return the User object to the endpoint function
+4. We look up that user_id (cached in memory for 60 seconds)
+5. We return a UserPrincipal snapshot to the endpoint function
 6. If ANY step fails → automatically returns 401 Unauthorized
 
 SECURITY DECISIONS:
+- argon2id for new hashes; bcrypt kept only to verify old ones,
+  which are re-hashed to argon2id on the next successful login
 - bcrypt==4.0.1 pinned (newer versions break passlib on Windows)
 - Tokens carry user_id only — no sensitive data in the token
 - SECRET_KEY lives in .env — never hardcoded
 """
 
 from passlib.context import CryptContext
-from jose import JWTError, jwt
+import jwt
+from jwt import ExpiredSignatureError, InvalidTokenError
+from cachetools import TTLCache
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db, User
+import asyncio
+import hashlib
+import time
 import os
 
 # ─────────────────────────────────────────
@@ -42,22 +52,69 @@ import os
 
 SECRET_KEY = os.getenv("SECRET_KEY", "changethisinproduction")
 ALGORITHM = "HS256"
+# Encoded once; PyJWT hands the bytes straight to the C-backed hmac
+_SIGNING_KEY = SECRET_KEY.encode()
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+USER_CACHE_TTL_SECONDS = 60
 
 # ─────────────────────────────────────────
 # PASSWORD HASHING
-# bcrypt is a one-way hash — you can never reverse it back to plain text
+# A one-way hash — you can never reverse it back to plain text
 # To verify: hash the input again and compare hashes
+#
+# argon2id is memory-hard, so it resists GPU cracking at a much
+# lower CPU cost per login than bcrypt at 12 rounds.
+# deprecated="auto" marks bcrypt as legacy: old hashes still
+# verify, and verify_and_update_password() hands login the upgrade.
+# parallelism=1: concurrency comes from the hashing pool below, so
+# each hash stays on one core; hashes made with other parameters
+# count as outdated and are upgraded on the next login.
+#
+# argon2 has no 72-byte input limit like bcrypt; the length cap is
+# only there to stay under passlib's 4096-byte password limit.
 # ─────────────────────────────────────────
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=12)
+MAX_PASSWORD_LENGTH = 1024   # characters; at most 4096 UTF-8 bytes
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=64 * 1024,   # KiB → 64 MB
+    argon2__parallelism=1,
+    bcrypt__rounds=12
+)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# Hashing is deliberately slow and argon2 takes 64 MB per call, so
+# it runs on a small dedicated pool: the event loop keeps serving
+# requests, and a burst of logins can't use up memory or the
+# threads shared with other blocking work.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+_hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, pwd_context.hash, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _hash_executor, pwd_context.verify, plain_password, hashed_password
+    )
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verify, and re-hash in the same pool trip when the stored hash is outdated.
+
+    Returns (verified, new_hash); new_hash is None unless it should be saved.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _hash_executor, pwd_context.verify_and_update, plain_password, hashed_password
+    )
 
 
 # ─────────────────────────────────────────
@@ -74,7 +131,7 @@ def create_access_token(user_id: str) -> str:
         "exp": expire,        # exp = when this token expires
         "type": "access"
     }
-    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(payload, _SIGNING_KEY, algorithm=ALGORITHM)
 
 def create_refresh_token(user_id: str) -> str:
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
@@ -83,7 +140,42 @@ def create_refresh_token(user_id: str) -> str:
         "exp": expire,
         "type": "refresh"
     }
-    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(payload, _SIGNING_KEY, algorithm=ALGORITHM)
+
+
+# ─────────────────────────────────────────
+# JWT VERIFICATION CACHE
+# A client reuses the same access token for up to 30 minutes, so
+# the signature is verified once per token and the payload cached.
+# Keys are 16-byte blake2b digests, so live tokens are not kept in
+# memory and each entry stays small; entries drop out once the
+# token could no longer be valid anyway. Expiry is re-checked on
+# every call, so a cached token still dies on time. SECRET_KEY only
+# changes on restart, which clears the cache. Only touched from the
+# event loop thread, so no lock is needed.
+# ─────────────────────────────────────────
+
+_token_cache = TTLCache(maxsize=10000, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+def _verify_signature(token: str) -> dict:
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    payload = _token_cache.get(key)
+    if payload is None:
+        # Raises InvalidTokenError on a bad signature (errors are never cached)
+        payload = jwt.decode(
+            token, _SIGNING_KEY, algorithms=[ALGORITHM],
+            options={"verify_exp": False}
+        )
+        _token_cache[key] = payload
+    return payload
+
+def decode_token(token: str) -> dict:
+    """Verified payload for token. Treat the returned dict as read-only."""
+    payload = _verify_signature(token)
+    exp = payload.get("exp")
+    if exp is None or exp <= time.time():
+        raise ExpiredSignatureError("Token has expired")
+    return payload
 
 
 # ─────────────────────────────────────────
@@ -95,29 +187,70 @@ def create_refresh_token(user_id: str) -> str:
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-def get_current_user(
+
+# ─────────────────────────────────────────
+# USER CACHE
+# The users row almost never changes, so get_current_user keeps
+# a short-lived snapshot per user_id instead of querying Postgres
+# on every request. Endpoints that change a user call
+# invalidate_user_cache() so the next request re-reads the row.
+# ─────────────────────────────────────────
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    id: str
+    email: str
+    is_active: bool
+    created_at: datetime
+
+
+# Only touched from the event loop thread, so no lock is needed
+_user_cache = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL_SECONDS)
+
+
+def invalidate_user_cache(user_id: str) -> None:
+    _user_cache.pop(user_id, None)
+
+
+async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
+    db: AsyncSession = Depends(get_db)
+) -> UserPrincipal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         user_id: str = payload.get("sub")
         token_type: str = payload.get("type")
 
         if user_id is None or token_type != "access":
             raise credentials_exception
 
-    except JWTError:
+    except InvalidTokenError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = _user_cache.get(user_id)
+
+    if user is None:
+        # Only the columns UserPrincipal needs — never hashed_password
+        row = (await db.execute(select(
+            User.id, User.email, User.is_active, User.created_at
+        ).where(User.id == user_id))).first()
+        if row is None:
+            raise credentials_exception
+
+        user = UserPrincipal(
+            id=row.id,
+            email=row.email,
+            is_active=row.is_active,
+            created_at=row.created_at
+        )
+        _user_cache[user_id] = user
 
-    if user is None or not user.is_active:
+    if not user.is_active:
         raise credentials_exception
 
     return user
\ No newline at end of file
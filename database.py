@@ -3,10 +3,11 @@ FILE: database.py
 ROLE: The data layer. Defines what data looks like and how to connect to it.
 
 WHAT THIS FILE DOES:
-- Creates the connection to Supabase PostgreSQL
+- Creates the async (asyncpg) connection pool to Supabase PostgreSQL
 - Defines all database tables as Python classes (models)
-- Provides get_db() which gives each request its own DB session
-- Auto-creates tables on startup if they don't exist
+- Provides get_db() which gives each request its own AsyncSession
+- init_db() (run at app startup) auto-creates tables and indexes,
+  applies idempotent schema upgrades and pre-opens pool connections
 
 TABLE RELATIONSHIPS:
 users (1) ──── documents (many)
@@ -14,6 +15,7 @@ users (1) ──── conversations (many)
 conversations (1) ──── messages (many)
 conversations (many) ──── documents (1) [optional]
 documents (1) ──── document_chunks (many)
+document_chunks (many) ──── chunk_blobs (1) [shared by identical text]
 
 WHAT THIS FILE DOES NOT DO:
 - Does not define API endpoints (that's main.py)
@@ -21,12 +23,16 @@ WHAT THIS FILE DOES NOT DO:
 - Does not handle auth (that's auth.py)
 """
 
-from sqlalchemy import create_engine, Column, String, DateTime, ARRAY, Text, Boolean, ForeignKey, Integer
+from sqlalchemy import event, make_url, DDL, Column, String, DateTime, Text, Boolean, ForeignKey, Integer, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from pgvector.sqlalchemy import Vector
+from sqlalchemy.orm import relationship
+from pgvector.sqlalchemy import HALFVEC
+from pgvector.asyncpg import register_vector
 from dotenv import load_dotenv
-from datetime import datetime
+from contextlib import AsyncExitStack
+import asyncio
 import uuid
 import os
 
@@ -34,30 +40,152 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(
-    DATABASE_URL,
+# Same DATABASE_URL as before (postgresql://...), driven by asyncpg.
+# asyncpg takes TLS through connect_args, not a sslmode query param.
+ASYNC_DATABASE_URL = make_url(DATABASE_URL).set(
+    drivername="postgresql+asyncpg"
+).difference_update_query(["sslmode"])
+
+# ─────────────────────────────────────────
+# CONNECTION POOL
+# SQLAlchemy's default (5 + 10 overflow) makes requests queue for a
+# connection under modest load. Sizes are per worker process — keep
+# pool_size + max_overflow under the database's connection limit.
+# pool_use_lifo reuses the most recently returned connection, so a
+# small warm set serves normal traffic and idle extras can expire.
+# pool_recycle drops connections before Supabase/PgBouncer idle
+# timeouts close them underneath us. pool_timeout bounds how long a
+# request waits for a free connection once the pool is exhausted;
+# main.py turns the resulting TimeoutError into a 503.
+#
+# Each request leases one connection: get_db is cached per request
+# by FastAPI, so get_current_user and the endpoint share the same
+# session, which checks a connection out on its first query.
+#
+# asyncpg prepares every statement and caches it per connection;
+# the cache is sized to hold every statement shape the app issues,
+# so hot paths skip parse/plan after the first call. Behind
+# PgBouncer in transaction mode (Supabase's port 6543 pooler)
+# prepared statements do not survive between transactions, so on a
+# pooler URL the cache is always off (DB_STATEMENT_CACHE_SIZE only
+# applies to direct and session-mode connections): each statement
+# then gets a unique name and is not reused.
+# ─────────────────────────────────────────
+
+TRANSACTION_POOLER = ASYNC_DATABASE_URL.port == 6543
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_STATEMENT_CACHE_SIZE = (
+    0 if TRANSACTION_POOLER else int(os.getenv("DB_STATEMENT_CACHE_SIZE", "1024"))
+)
+# Connections opened at startup so the first requests don't each pay
+# for a TCP + TLS handshake and codec setup
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "5"))
+
+connect_args = {"ssl": "require", "statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+if DB_STATEMENT_CACHE_SIZE == 0:
+    connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+
+engine = create_async_engine(
+    ASYNC_DATABASE_URL.update_query_dict(
+        {"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)}
+    ),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=1800,
     pool_pre_ping=True,
-    connect_args={"sslmode": "require"}
+    pool_use_lifo=True,
+    connect_args=connect_args
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Schema the vector extension lives in — Supabase installs it in
+# `extensions`, not `public`. Looked up on the first connection
+# (init_db's) and reused for every connection after it.
+VECTOR_SCHEMA = None
+
+
+async def register_vector_codecs(conn) -> None:
+    global VECTOR_SCHEMA
+    if VECTOR_SCHEMA is None:
+        VECTOR_SCHEMA = await conn.fetchval("""
+            SELECT n.nspname FROM pg_extension e
+            JOIN pg_namespace n ON n.oid = e.extnamespace
+            WHERE e.extname = 'vector'
+        """)
+    await register_vector(conn, schema=VECTOR_SCHEMA)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def register_vector_type(dbapi_connection, connection_record):
+    # Binary codecs: HalfVector objects bind directly and halfvec
+    # columns come back as HalfVector (no string parsing).
+    # Embeddings are written with raw SQL passing HalfVector values —
+    # the ORM HALFVEC type binds text, which this codec does not take.
+    dbapi_connection.run_async(register_vector_codecs)
+
+
+# expire_on_commit=False: attributes stay readable after commit
+# without an implicit (and, in async, impossible) lazy reload
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
 Base = declarative_base()
 
 
+# Ids and timestamps are filled in by Postgres and come back through
+# INSERT ... RETURNING. Timestamp columns are naive UTC.
+#
+# Ids are UUIDv7: a 48-bit millisecond timestamp followed by random
+# bits, so new keys land at the right-hand edge of the primary key
+# index instead of on random leaf pages. gen_uuid_v7() stamps the
+# clock into a gen_random_uuid() and sets the version bits to 7; it
+# is created ahead of the tables that default to it.
+UUID_V7_FUNCTION = DDL("""
+    CREATE OR REPLACE FUNCTION gen_uuid_v7() RETURNS uuid AS $$
+        SELECT encode(
+            set_bit(set_bit(
+                overlay(uuid_send(gen_random_uuid())
+                        placing substring(int8send(
+                            floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint
+                        ) FROM 3)
+                        FROM 1 FOR 6),
+                52, 1), 53, 1),
+            'hex')::uuid
+    $$ LANGUAGE sql VOLATILE
+""")
+event.listen(Base.metadata, "before_create", UUID_V7_FUNCTION)
+
+UUID_DEFAULT = text("gen_uuid_v7()::text")
+UTC_NOW = text("timezone('utc', now())")
+# now() is fixed at the start of the transaction; the wall clock at
+# the statement, for a row that must sort after earlier ones written
+# in the same transaction
+UTC_CLOCK = text("timezone('utc', clock_timestamp())")
+
+# Relationships are declared lazy="raise": touching one that was not
+# loaded up front (selectinload/joinedload) raises instead of quietly
+# issuing a query per row, which an AsyncSession can't do anyway.
+# passive_deletes leaves child rows to the database's own cascades.
+
+
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, server_default=UUID_DEFAULT)
     email = Column(String, unique=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=UTC_NOW)
+
+    documents = relationship("Document", back_populates="owner", lazy="raise", passive_deletes=True)
 
 
 class Document(Base):
     __tablename__ = "documents"
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, server_default=UUID_DEFAULT)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     title = Column(String, nullable=False)
     content = Column(Text, nullable=False)
@@ -66,77 +194,328 @@ class Document(Base):
     file_type = Column(String, nullable=True)
     is_processed = Column(Boolean, default=False)
     summary = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow)
+    # blake2b-256 of the uploaded file; unique per user (ux_documents_user_content_hash)
+    content_hash = Column(String, nullable=True)
+    created_at = Column(DateTime, server_default=UTC_NOW)
+    updated_at = Column(DateTime, server_default=UTC_NOW)
+
+    owner = relationship("User", back_populates="documents", lazy="raise")
+    conversations = relationship("Conversation", back_populates="document", lazy="raise", passive_deletes=True)
 
 
 # ─────────────────────────────────────────
-# DOCUMENT CHUNK TABLE
+# CHUNK BLOB TABLE
 # Each document is split into small overlapping chunks.
-# Each chunk gets an embedding — a vector of 768 numbers
-# (Gemini embedding dimension is 768, OpenAI is 1536).
+# Each chunk gets an embedding — a vector of 1536 numbers.
 # The embedding captures the semantic meaning of the chunk.
 # When a user asks a question, we embed the question too,
 # then find chunks whose embeddings are most similar.
+#
+# Text + embedding live here once per distinct chunk, keyed by
+# sha256(content). The same boilerplate in N documents is
+# embedded once, stored once and indexed once; re-processing a
+# document only pays OpenAI for chunks it has never seen.
+#
+# Stored as halfvec (fp16, pgvector 0.7+): 3 KB per row instead
+# of 6 KB, so the HNSW index is half the size and distance
+# scans read half the bytes. Recall loss is ~1% and results
+# are re-ranked in fp32 anyway.
+# ─────────────────────────────────────────
+
+class ChunkBlob(Base):
+    __tablename__ = "chunk_blobs"
+
+    id = Column(String, primary_key=True)      # sha256(content) hex
+    content = Column(Text, nullable=False)
+    embedding = Column(HALFVEC(1536))
+    model = Column(String, nullable=True)      # embedding model that produced it
+    created_at = Column(DateTime, server_default=UTC_NOW)
+
+
+# ─────────────────────────────────────────
+# DOCUMENT CHUNK TABLE
+# Where a blob appears: which document, owned by whom, at
+# which position. Rows are small, so a document is cheap to
+# re-chunk or delete.
 # ─────────────────────────────────────────
 
 class DocumentChunk(Base):
     __tablename__ = "document_chunks"
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, server_default=UUID_DEFAULT)
     document_id = Column(String, ForeignKey("documents.id"), nullable=False)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
-    content = Column(Text, nullable=False)
+    blob_id = Column(String, ForeignKey("chunk_blobs.id"), nullable=False)
     chunk_index = Column(Integer, nullable=False)
-    embedding = Column(Vector(1536))   # Gemini uses 768 dimensions
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=UTC_NOW)
 
 
 class Conversation(Base):
     __tablename__ = "conversations"
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, server_default=UUID_DEFAULT)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
-    document_id = Column(String, ForeignKey("documents.id"), nullable=True)
+    document_id = Column(String, ForeignKey("documents.id", ondelete="CASCADE"), nullable=True)
     document_ids = Column(ARRAY(String), default=[])
     title = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=UTC_NOW)
+    updated_at = Column(DateTime, server_default=UTC_NOW)
+
+    document = relationship("Document", back_populates="conversations", lazy="raise")
+    messages = relationship("Message", back_populates="conversation", lazy="raise", passive_deletes=True)
 
 
 class Message(Base):
     __tablename__ = "messages"
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    conversation_id = Column(String, ForeignKey("conversations.id"), nullable=False)
+    id = Column(String, primary_key=True, server_default=UUID_DEFAULT)
+    conversation_id = Column(String, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
     role = Column(String, nullable=False)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=UTC_NOW)
+
+    conversation = relationship("Conversation", back_populates="messages", lazy="raise")
 
 class PasswordResetToken(Base):
     __tablename__ = "password_reset_tokens"
 
-    id = Column(String, primary_key=True)
+    id = Column(String, primary_key=True, server_default=UUID_DEFAULT)
     user_id = Column(String, ForeignKey("users.id"))
     token = Column(String, unique=True)
     expires_at = Column(DateTime)
     used = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=UTC_NOW)
 
 class ShareLink(Base):
     __tablename__ = "share_links"
 
-    id = Column(String, primary_key=True)
-    conversation_id = Column(String, ForeignKey("conversations.id"))
+    id = Column(String, primary_key=True, server_default=UUID_DEFAULT)
+    conversation_id = Column(String, ForeignKey("conversations.id", ondelete="CASCADE"))
     token = Column(String, unique=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=UTC_NOW)
     
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+# ─────────────────────────────────────────
+# SCHEMA UPGRADES + INDEXES
+# create_all() only creates missing tables — it never touches
+# tables that already exist. Column changes and indexes are
+# applied with idempotent raw DDL so this is safe on every startup.
+#
+# HNSW turns "ORDER BY embedding <=> :q LIMIT k" from a scan
+# over every blob into a walk of a small-world graph.
+# halfvec_cosine_ops matches the <=> (cosine distance) operator.
+# The btree on (user_id, document_id, chunk_index) lets the
+# planner apply the ownership filter without touching unrelated
+# chunks, and serves the ordered chunk preview directly.
+# ─────────────────────────────────────────
+
+# Full-text search vector for documents. search_documents must use
+# this exact expression for Postgres to match it to the GIN index.
+DOCUMENT_TSVECTOR = "to_tsvector('english', title || ' ' || content)"
+
+SCHEMA_DDL = [
+    # Split the old document_chunks(content, embedding) into
+    # chunk_blobs + references. Blob ids are computed in SQL with
+    # the same sha256-hex the app uses; the old vector column is
+    # cast to halfvec on the way over. Dropping the embedding
+    # column also drops the old per-chunk HNSW index.
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'document_chunks' AND column_name = 'content'
+        ) THEN
+            INSERT INTO chunk_blobs (id, content, embedding, model, created_at)
+            SELECT DISTINCT ON (h)
+                h, content, embedding::halfvec(1536), 'text-embedding-3-small', created_at
+            FROM (
+                SELECT encode(sha256(convert_to(content, 'UTF8')), 'hex') AS h,
+                       content, embedding, created_at
+                FROM document_chunks
+            ) c
+            ORDER BY h, embedding IS NULL
+            ON CONFLICT (id) DO NOTHING;
+
+            ALTER TABLE document_chunks ADD COLUMN blob_id VARCHAR;
+            UPDATE document_chunks
+            SET blob_id = encode(sha256(convert_to(content, 'UTF8')), 'hex');
+            ALTER TABLE document_chunks
+                ALTER COLUMN blob_id SET NOT NULL,
+                ADD FOREIGN KEY (blob_id) REFERENCES chunk_blobs (id),
+                DROP COLUMN content,
+                DROP COLUMN embedding;
+        END IF;
+    END $$
+    """,
+    # Superseded by chunk_blobs (same key, plus the text)
+    "DROP TABLE IF EXISTS embedding_cache",
+    """
+    CREATE INDEX IF NOT EXISTS idx_chunk_blobs_embedding_hnsw
+    ON chunk_blobs USING hnsw (embedding halfvec_cosine_ops)
+    WITH (m = 24, ef_construction = 128)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_chunks_user_doc_index
+    ON document_chunks (user_id, document_id, chunk_index)
+    """,
+    # Superseded by idx_chunks_user_doc_index (same leading columns)
+    "DROP INDEX IF EXISTS idx_chunks_user_document",
+    # "Is this blob still referenced?" when documents are deleted
+    """
+    CREATE INDEX IF NOT EXISTS idx_chunks_blob
+    ON document_chunks (blob_id)
+    """,
+    # "Last N messages of a conversation" becomes an index walk that
+    # stops after N rows; the same index serves oldest-first reads
+    # by scanning it backwards.
+    """
+    CREATE INDEX IF NOT EXISTS ix_messages_conv_time
+    ON messages (conversation_id, created_at DESC)
+    """,
+    # Server-side defaults for tables created before they were declared
+    *(
+        f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT gen_uuid_v7()::text"
+        for table in (
+            "users", "documents", "document_chunks", "conversations",
+            "messages", "password_reset_tokens", "share_links",
+        )
+    ),
+    *(
+        f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT timezone('utc', now())"
+        for table, column in (
+            ("users", "created_at"),
+            ("documents", "created_at"), ("documents", "updated_at"),
+            ("chunk_blobs", "created_at"),
+            ("document_chunks", "created_at"),
+            ("conversations", "created_at"), ("conversations", "updated_at"),
+            ("messages", "created_at"),
+            ("password_reset_tokens", "created_at"),
+            ("share_links", "created_at"),
+        )
+    ),
+    # Substring matches on titles in search_documents. pg_trgm ships
+    # with Supabase; where it is not installable the ILIKE still works,
+    # just without an index.
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX IF NOT EXISTS ix_documents_title_trgm
+            ON documents USING gin (title gin_trgm_ops);
+        END IF;
+    END $$
+    """,
+    # Re-uploading the same file returns the existing document.
+    # Documents created from text (content_hash NULL) never collide.
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR",
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_documents_user_content_hash
+    ON documents (user_id, content_hash)
+    """,
+    # A user's documents / conversations, most recently updated first.
+    # Ownership lookups by (id, user_id) already go through the primary
+    # key, so an extra (user_id, id) index would add nothing.
+    """
+    CREATE INDEX IF NOT EXISTS ix_documents_user_updated
+    ON documents (user_id, updated_at DESC)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_conversations_user_updated
+    ON conversations (user_id, updated_at DESC)
+    """,
+    # Deleting a conversation takes its messages and share links with
+    # it, and deleting a document takes its single-doc conversations.
+    # Recreates foreign keys made before these were ON DELETE CASCADE.
+    """
+    DO $$
+    DECLARE
+        fk record;
+    BEGIN
+        FOR fk IN
+            SELECT c.conrelid::regclass AS tbl, c.conname, a.attname AS col,
+                   c.confrelid::regclass AS ref
+            FROM pg_constraint c
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+            WHERE c.contype = 'f' AND c.confdeltype <> 'c'
+              AND (c.conrelid::regclass, a.attname) IN (
+                  ('messages'::regclass, 'conversation_id'),
+                  ('share_links'::regclass, 'conversation_id'),
+                  ('conversations'::regclass, 'document_id')
+              )
+        LOOP
+            EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', fk.tbl, fk.conname);
+            EXECUTE format(
+                'ALTER TABLE %s ADD FOREIGN KEY (%I) REFERENCES %s (id) ON DELETE CASCADE',
+                fk.tbl, fk.col, fk.ref
+            );
+        END LOOP;
+    END $$
+    """,
+    # Referencing-side indexes for the cascades above
+    """
+    CREATE INDEX IF NOT EXISTS ix_conversations_document
+    ON conversations (document_id)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_share_links_conversation
+    ON share_links (conversation_id)
+    """,
+    f"""
+    CREATE INDEX IF NOT EXISTS ix_documents_fts
+    ON documents USING gin ({DOCUMENT_TSVECTOR})
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_documents_tags
+    ON documents USING gin (tags)
+    """,
+]
+
+
+async def apply_schema_ddl(conn) -> None:
+    # Only matters the first time an index is actually built
+    await conn.execute(text("SET LOCAL maintenance_work_mem = '2GB'"))
+    await conn.execute(text("SET LOCAL max_parallel_maintenance_workers = 7"))
+    for ddl in SCHEMA_DDL:
+        await conn.execute(text(ddl))
+
+
+async def get_pgvector_version(conn) -> tuple:
+    version = (await conn.execute(text(
+        "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+    ))).scalar()
+    return tuple(int(part) for part in version.split("."))
+
+
+# pgvector 0.8+ can keep walking the HNSW graph until enough rows
+# pass the WHERE filter (otherwise a strict user/document filter
+# can leave fewer than LIMIT results from the ef_search candidates).
+# Set by init_db(); read it as database.HNSW_ITERATIVE_SCAN.
+PGVECTOR_VERSION = (0, 0, 0)
+HNSW_ITERATIVE_SCAN = False
+
+
+async def init_db() -> None:
+    """Create tables, apply schema upgrades, detect pgvector. Run once at startup."""
+    global PGVECTOR_VERSION, HNSW_ITERATIVE_SCAN
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await apply_schema_ddl(conn)
+        PGVECTOR_VERSION = await get_pgvector_version(conn)
+    HNSW_ITERATIVE_SCAN = PGVECTOR_VERSION >= (0, 8, 0)
+    await warm_pool(min(DB_POOL_WARM, DB_POOL_SIZE))
+
+
+async def warm_pool(size: int) -> None:
+    """Open `size` pooled connections at once and hand them back to the pool."""
+    async with AsyncExitStack() as stack:
+        # Held together, so each checkout opens a new connection
+        # instead of reusing the one just returned
+        await asyncio.gather(*(
+            stack.enter_async_context(engine.connect()) for _ in range(size)
+        ))
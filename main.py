@@ -15,27 +15,39 @@ WHAT THIS FILE DOES NOT DO:
 - Does not talk to external services directly
 
 IMPORTS FROM:
-- database.py → Document, User, get_db
-- auth.py → hash_password, verify_password, create_access_token,
-             create_refresh_token, get_current_user
+- database.py → Document, User, get_db, SessionLocal, init_db
+- pdf_text.py → count_pdf_pages, extract_pdf_pages (run in the PDF worker pool)
+- auth.py → hash_password, verify_password, verify_and_update_password, create_access_token,
+             create_refresh_token, get_current_user, UserPrincipal
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, Request, status, UploadFile, File, BackgroundTasks
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, EmailStr
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, EmailStr
+from sqlalchemy import select, insert, update, delete, exists, or_, func, case, any_, literal_column
+from sqlalchemy.dialects.postgresql import array, insert as pg_insert
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import Optional
+from typing import IO, Optional
 from supabase import create_client, Client
+from cachetools import TTLCache
 from dotenv import load_dotenv
 import uuid
 import os
-import io
 import json
-import PyPDF2
+import codecs
+import hashlib
+import asyncio
+import tempfile
+import multiprocessing
+from pypdfium2 import PdfiumError
 import resend
 import secrets
 from datetime import timedelta
@@ -43,14 +55,16 @@ from datetime import timedelta
 
 from ai import (
     process_document, generate_rag_response, generate_summary,
-    client, find_relevant_chunks, find_relevant_chunks_multi,
-    get_conversation_history, build_messages
+    aclient, find_relevant_chunks, find_relevant_chunks_multi,
+    get_conversation_history, build_messages, stream_chat_completion,
+    delete_document_chunks, prune_orphan_blobs
 )
-from database import Document, User, Conversation, Message, DocumentChunk, PasswordResetToken, ShareLink, get_db
+from pdf_text import count_pdf_pages, extract_pdf_pages
+from database import Document, User, Conversation, Message, DocumentChunk, ChunkBlob, PasswordResetToken, ShareLink, get_db, SessionLocal, init_db, engine, DOCUMENT_TSVECTOR, UTC_NOW, UTC_CLOCK
 from auth import (
-    hash_password, verify_password,
+    hash_password, verify_password, verify_and_update_password, MAX_PASSWORD_LENGTH,
     create_access_token, create_refresh_token,
-    get_current_user
+    get_current_user, invalidate_user_cache, UserPrincipal
 )
 
 load_dotenv()
@@ -59,7 +73,28 @@ load_dotenv()
 # APP SETUP
 # ─────────────────────────────────────────
 
-app = FastAPI(title="DocMind API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    # Every route is registered by now; build the schema before the
+    # first request instead of on the first /docs hit
+    app.openapi()
+    yield
+    await engine.dispose()
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(cancel_futures=True)
+
+app = FastAPI(title="DocMind API", version="1.0.0", lifespan=lifespan)
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # Every pooled connection stayed busy for DB_POOL_TIMEOUT seconds;
+    # shed the request instead of queueing it behind the others
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database is busy, please retry"},
+        headers={"Retry-After": "1"}
+    )
 
 app.add_middleware(
     CORSMiddleware,
@@ -73,6 +108,11 @@ supabase: Client = create_client(
     os.getenv("SUPABASE_URL"),
     os.getenv("SUPABASE_KEY")
 )
+# Bucket proxy bound once; it shares the storage client's pooled HTTP session
+documents_bucket = supabase.storage.from_("documents")
+
+# Shared by every operation; the schema is only ever read
+BEARER_SECURITY = [{"BearerAuth": []}]
 
 def custom_openapi():
     if app.openapi_schema:
@@ -90,13 +130,25 @@ def custom_openapi():
             "bearerFormat": "JWT",
         }
     }
-    for path in openapi_schema["paths"].values():
-        for operation in path.values():
-            operation["security"] = [{"BearerAuth": []}]
+    for operation in (op for path in openapi_schema["paths"].values() for op in path.values()):
+        operation["security"] = BEARER_SECURITY
     app.openapi_schema = openapi_schema
+    global _openapi_json
+    _openapi_json = json.dumps(openapi_schema).encode()
     return app.openapi_schema
 
 app.openapi = custom_openapi
+_openapi_json: bytes | None = None
+
+# FastAPI's own /openapi.json route re-encodes the schema dict on
+# every hit; swap it for one that sends the bytes encoded once above
+app.router.routes = [r for r in app.router.routes if getattr(r, "path", None) != app.openapi_url]
+
+@app.get(app.openapi_url, include_in_schema=False)
+async def openapi_json():
+    if _openapi_json is None:
+        custom_openapi()
+    return Response(content=_openapi_json, media_type="application/json")
 
 
 # ─────────────────────────────────────────
@@ -112,8 +164,7 @@ class UserResponse(BaseModel):
     email: str
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class PasswordChange(BaseModel):
     current_password: str
@@ -147,8 +198,7 @@ class DocumentResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ConversationCreate(BaseModel):
     title: str
@@ -164,8 +214,7 @@ class ConversationResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class MessageCreate(BaseModel):
     content: str
@@ -177,8 +226,7 @@ class MessageResponse(BaseModel):
     content: str
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ForgotPasswordRequest(BaseModel):
     email: EmailStr
@@ -194,8 +242,47 @@ class ShareLinkResponse(BaseModel):
     url: str
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+
+# Endpoints with a response_model are serialized straight to JSON
+# bytes by Pydantic's Rust core; a bare dict goes through
+# jsonable_encoder + json.dumps instead
+class HealthResponse(BaseModel):
+    status: str
+    timestamp: datetime
+    version: str
+    document_count: int
+    user_count: int
+
+class StatsResponse(BaseModel):
+    documents: int
+    processed_documents: int
+    conversations: int
+    messages: int
+    chunks_indexed: int
+    member_since: Optional[datetime] = None
+
+class ChunkPreview(BaseModel):
+    index: int
+    preview: str
+
+class DocumentChunksResponse(BaseModel):
+    document_id: str
+    is_processed: bool
+    chunk_count: int
+    chunks: list[ChunkPreview]
+
+
+# Read endpoints select just the response columns and build the
+# models with model_construct: the rows come straight from our own
+# schema, so the from_attributes validation pass is skipped. FastAPI
+# passes constructed instances through and dumps them to JSON.
+def response_columns(table, model: type[BaseModel]) -> list:
+    return [getattr(table, name) for name in model.model_fields]
+
+
+def construct_all(model: type[BaseModel], rows) -> list:
+    return [model.model_construct(**row._mapping) for row in rows]
 
 # ─────────────────────────────────────────
 # ROOT + HEALTH
@@ -205,10 +292,21 @@ class ShareLinkResponse(BaseModel):
 async def root():
     return {"message": "DocMind API is running"}
 
-@app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
-    doc_count = db.query(Document).count()
-    user_count = db.query(User).count()
+# Probes poll /health every few seconds; the counts are recomputed
+# at most every 30 seconds instead of scanning both tables each time
+_health_counts = TTLCache(maxsize=1, ttl=30)
+
+@app.get("/health", response_model=HealthResponse)
+async def health_check(db: AsyncSession = Depends(get_db)):
+    counts = _health_counts.get("counts")
+    if counts is None:
+        # Both counts in one round-trip
+        counts = (await db.execute(select(
+            select(func.count()).select_from(Document).scalar_subquery(),
+            select(func.count()).select_from(User).scalar_subquery()
+        ))).one()
+        _health_counts["counts"] = counts
+    doc_count, user_count = counts
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow(),
@@ -223,33 +321,41 @@ async def health_check(db: Session = Depends(get_db)):
 # ─────────────────────────────────────────
 
 @app.post("/auth/register", response_model=UserResponse, status_code=201)
-async def register(user_data: UserRegister, db: Session = Depends(get_db)):
-    if len(user_data.password) > 72:
-        raise HTTPException(status_code=400, detail="Password must be 72 characters or less")
+async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
+    if len(user_data.password) > MAX_PASSWORD_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Password must be {MAX_PASSWORD_LENGTH} characters or less")
 
-    existing = db.query(User).filter(User.email == user_data.email).first()
+    existing = await db.scalar(select(exists().where(User.email == user_data.email)))
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    user = User(
-        id=str(uuid.uuid4()),
+    user = (await db.execute(insert(User).values(
         email=user_data.email,
-        hashed_password=hash_password(user_data.password)
-    )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+        hashed_password=await hash_password(user_data.password)
+    ).returning(User))).scalar_one()
+    await db.commit()
     return user
 
 @app.post("/auth/login", response_model=TokenResponse)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = (await db.execute(
+        select(User.id, User.hashed_password).where(User.email == form_data.username)
+    )).one_or_none()
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
+    # One trip to the hashing pool verifies and, for a legacy bcrypt
+    # (or outdated argon2) hash, makes the upgrade while we have the password
+    verified, new_hash = await verify_and_update_password(form_data.password, user.hashed_password)
+    if not verified:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    if new_hash:
+        await db.execute(update(User).where(User.id == user.id).values(hashed_password=new_hash))
+        await db.commit()
+
     return TokenResponse(
         access_token=create_access_token(user.id),
         refresh_token=create_refresh_token(user.id),
@@ -257,53 +363,57 @@ async def login(
     )
 
 @app.get("/auth/me", response_model=UserResponse)
-async def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: UserPrincipal = Depends(get_current_user)):
     return current_user
 
 @app.post("/auth/change-password")
 async def change_password(
     data: PasswordChange,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    if not verify_password(data.current_password, current_user.hashed_password):
+    # current_user is a cached snapshot — load the row we are changing
+    user = await db.get(User, current_user.id)
+    if not await verify_password(data.current_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     if len(data.new_password) < 8:
         raise HTTPException(status_code=400, detail="New password must be at least 8 characters")
-    if len(data.new_password) > 72:
-        raise HTTPException(status_code=400, detail="Password must be 72 characters or less")
+    if len(data.new_password) > MAX_PASSWORD_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Password must be {MAX_PASSWORD_LENGTH} characters or less")
 
-    current_user.hashed_password = hash_password(data.new_password)
-    db.commit()
+    user.hashed_password = await hash_password(data.new_password)
+    await db.commit()
+    invalidate_user_cache(user.id)
     return {"message": "Password changed successfully"}
 
 @app.post("/auth/forgot-password")
 async def forgot_password(
     data: ForgotPasswordRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     resend.api_key = os.getenv("RESEND_API_KEY")
 
-    user = db.query(User).filter(User.email == data.email).first()
+    user = (await db.execute(
+        select(User.id, User.email).where(User.email == data.email)
+    )).first()
     if not user:
         return {"message": "If that email exists, a reset link has been sent"}
 
-    db.query(PasswordResetToken).filter(
+    await db.execute(delete(PasswordResetToken).where(
         PasswordResetToken.user_id == user.id,
         PasswordResetToken.used == False
-    ).delete()
+    ))
 
     token = secrets.token_urlsafe(32)
     expires_at = datetime.utcnow() + timedelta(hours=1)
 
     reset_token = PasswordResetToken(
-        id=str(uuid.uuid4()),
         user_id=user.id,
         token=token,
         expires_at=expires_at
     )
     db.add(reset_token)
-    db.commit()
+    await db.commit()
 
     frontend_url = os.getenv("FRONTEND_URL", "https://docmind-frontend-eight.vercel.app")
     reset_link = f"{frontend_url}/reset-password?token={token}"
@@ -342,12 +452,12 @@ async def forgot_password(
 @app.post("/auth/reset-password")
 async def reset_password(
     data: ResetPasswordRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    reset_token = db.query(PasswordResetToken).filter(
+    reset_token = (await db.execute(select(PasswordResetToken).where(
         PasswordResetToken.token == data.token,
         PasswordResetToken.used == False
-    ).first()
+    ))).scalar_one_or_none()
 
     if not reset_token:
         raise HTTPException(status_code=400, detail="Invalid or expired reset token")
@@ -357,23 +467,24 @@ async def reset_password(
 
     if len(data.new_password) < 8:
         raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
-    if len(data.new_password) > 72:
-        raise HTTPException(status_code=400, detail="Password must be 72 characters or less")
+    if len(data.new_password) > MAX_PASSWORD_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Password must be {MAX_PASSWORD_LENGTH} characters or less")
 
     # Update password
-    user = db.query(User).filter(User.id == reset_token.user_id).first()
-    user.hashed_password = hash_password(data.new_password)
+    user = await db.get(User, reset_token.user_id)
+    user.hashed_password = await hash_password(data.new_password)
 
     # Mark token as used
     reset_token.used = True
-    db.commit()
+    await db.commit()
+    invalidate_user_cache(user.id)
 
     return {"message": "Password reset successfully"}
 
 @app.post("/auth/google")
 async def google_auth(
     payload: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     from google.oauth2 import id_token
     from google.auth.transport import requests as google_requests
@@ -398,18 +509,18 @@ async def google_auth(
         raise HTTPException(status_code=400, detail="Could not get email from Google account")
 
     # Find or create user
-    user = db.query(User).filter(User.email == email).first()
+    user = (await db.execute(
+        select(User).where(User.email == email)
+    )).scalar_one_or_none()
     if not user:
         # New user — create account with a random unusable password
         import secrets as secrets_lib
         user = User(
-            id=str(uuid.uuid4()),
             email=email,
-            hashed_password=hash_password(secrets_lib.token_urlsafe(32))
+            hashed_password=await hash_password(secrets_lib.token_urlsafe(32))
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
 
     return TokenResponse(
         access_token=create_access_token(user.id),
@@ -417,21 +528,27 @@ async def google_auth(
         token_type="bearer"
     )
 
-@app.get("/auth/stats")
+@app.get("/auth/stats", response_model=StatsResponse)
 async def get_stats(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    doc_count = db.query(Document).filter(Document.user_id == current_user.id).count()
-    processed_count = db.query(Document).filter(
+    doc_count = await db.scalar(select(func.count()).select_from(Document).where(
+        Document.user_id == current_user.id
+    ))
+    processed_count = await db.scalar(select(func.count()).select_from(Document).where(
         Document.user_id == current_user.id,
         Document.is_processed == True
-    ).count()
-    conv_count = db.query(Conversation).filter(Conversation.user_id == current_user.id).count()
-    msg_count = db.query(Message).join(Conversation).filter(
+    ))
+    conv_count = await db.scalar(select(func.count()).select_from(Conversation).where(
         Conversation.user_id == current_user.id
-    ).count()
-    chunk_count = db.query(DocumentChunk).filter(DocumentChunk.user_id == current_user.id).count()
+    ))
+    msg_count = await db.scalar(select(func.count()).select_from(Message).join(Conversation).where(
+        Conversation.user_id == current_user.id
+    ))
+    chunk_count = await db.scalar(select(func.count()).select_from(DocumentChunk).where(
+        DocumentChunk.user_id == current_user.id
+    ))
 
     return {
         "documents": doc_count,
@@ -449,129 +566,126 @@ async def get_stats(
 @app.post("/documents", response_model=DocumentResponse, status_code=201)
 async def create_document(
     doc: DocumentCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    db_doc = Document(
-        id=str(uuid.uuid4()),
+    db_doc = (await db.execute(insert(Document).values(
         user_id=current_user.id,
         title=doc.title,
         content=doc.content,
         tags=doc.tags
-    )
-    db.add(db_doc)
-    db.commit()
-    db.refresh(db_doc)
+    ).returning(Document))).scalar_one()
+    await db.commit()
     return db_doc
 
 @app.get("/documents", response_model=list[DocumentResponse])
 async def list_documents(
     limit: int = 50,
     offset: int = 0,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    return db.query(Document).filter(
+    # Walks ix_documents_user_updated in order — no sort step, and
+    # offset/limit pages are stable
+    result = await db.execute(select(*response_columns(Document, DocumentResponse)).where(
         Document.user_id == current_user.id
-    ).offset(offset).limit(limit).all()
+    ).order_by(
+        Document.updated_at.desc()
+    ).offset(offset).limit(limit))
+    return construct_all(DocumentResponse, result)
 
 @app.get("/documents/search", response_model=list[DocumentResponse])
 async def search_documents(
     q: str,
     limit: int = 10,
     offset: int = 0,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    if not q or len(q.strip()) == 0:
+    term = q.strip() if q else ""
+    if not term:
         raise HTTPException(status_code=400, detail="Search query cannot be empty")
 
-    search_term = f"%{q.strip()}%"
-    results = db.query(Document).filter(
+    # Every predicate is served by a GIN index (ix_documents_fts,
+    # ix_documents_tags, ix_documents_title_trgm), so each one is a
+    # bitmap probe OR'd in, not a per-row filter. The tag check stays
+    # on for multi-word queries because tags may contain spaces.
+    document_vector = literal_column(DOCUMENT_TSVECTOR)
+    query = func.websearch_to_tsquery(literal_column("'english'"), term)
+    matches = [
+        document_vector.op("@@")(query),
+        Document.tags.contains([term.lower()])
+    ]
+    # Word stems miss partial words ("fras" in "frustrate"); a title
+    # substring match covers them. Trigram indexes need 3+ characters.
+    if len(term) >= 3:
+        matches.append(Document.title.icontains(term, autoescape=True))
+
+    results = await db.execute(select(*response_columns(Document, DocumentResponse)).where(
         Document.user_id == current_user.id,
-        (
-            Document.title.ilike(search_term) |
-            Document.content.ilike(search_term) |
-            Document.tags.any(q.strip().lower())
-        )
+        or_(*matches)
     ).order_by(
+        func.ts_rank_cd(document_vector, query).desc(),
         Document.updated_at.desc()
-    ).offset(offset).limit(limit).all()
+    ).offset(offset).limit(limit))
 
-    return results
+    return construct_all(DocumentResponse, results)
 
 @app.get("/documents/{doc_id}", response_model=DocumentResponse)
 async def get_document(
     doc_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    doc = db.query(Document).filter(
+    doc = (await db.execute(select(*response_columns(Document, DocumentResponse)).where(
         Document.id == doc_id,
         Document.user_id == current_user.id
-    ).first()
+    ))).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
-    return doc
+    return DocumentResponse.model_construct(**doc._mapping)
 
 @app.patch("/documents/{doc_id}", response_model=DocumentResponse)
 async def update_document(
     doc_id: str,
     updates: DocumentUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    doc = db.query(Document).filter(
+    changes = updates.model_dump(exclude_none=True)
+
+    # Ownership check, write and re-read in one statement
+    doc = (await db.execute(update(Document).where(
         Document.id == doc_id,
         Document.user_id == current_user.id
-    ).first()
+    ).values(
+        **changes, updated_at=UTC_NOW
+    ).returning(*response_columns(Document, DocumentResponse)))).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
-
-    if updates.title is not None:
-        doc.title = updates.title
-    if updates.content is not None:
-        doc.content = updates.content
-    if updates.tags is not None:
-        doc.tags = updates.tags
-
-    doc.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(doc)
-    return doc
+    await db.commit()
+    return DocumentResponse.model_construct(**doc._mapping)
 
 @app.delete("/documents/{doc_id}")
 async def delete_document(
     doc_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    doc = db.query(Document).filter(
+    owned = await db.scalar(select(exists().where(
         Document.id == doc_id,
         Document.user_id == current_user.id
-    ).first()
-    if not doc:
+    )))
+    if not owned:
         raise HTTPException(status_code=404, detail="Document not found")
 
     # Delete chunks first (FK constraint)
-    db.query(DocumentChunk).filter(
-        DocumentChunk.document_id == doc_id
-    ).delete()
-
-    # Delete linked conversations and their messages
-    convs = db.query(Conversation).filter(
-        Conversation.document_id == doc_id
-    ).all()
-    for conv in convs:
-        db.query(Message).filter(
-            Message.conversation_id == conv.id
-        ).delete()
-    db.query(Conversation).filter(
-        Conversation.document_id == doc_id
-    ).delete()
-
-    db.delete(doc)
-    db.commit()
+    blob_ids = await delete_document_chunks(doc_id, db)
+
+    # Linked conversations, their messages and share links cascade
+    await db.execute(delete(Document).where(Document.id == doc_id))
+    await prune_orphan_blobs(blob_ids, db)
+    await db.commit()
     return {"message": "Document deleted successfully", "id": doc_id}
 
 
@@ -579,19 +693,58 @@ async def delete_document(
 # FILE UPLOAD HELPERS
 # ─────────────────────────────────────────
 
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
-    text = ""
-    for page in pdf_reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            text += page_text + "\n"
-    return text.strip()
-
-def upload_to_supabase(file_bytes: bytes, file_path: str, content_type: str) -> str:
-    supabase.storage.from_("documents").upload(
+# PDFium (C++) does the parsing. It is not thread-safe, so pages are
+# parsed in worker processes instead: each worker opens its own copy
+# of the PDF and extracts one run of pages, and a long PDF is spread
+# over several cores rather than pegging one.
+# Workers come from a forkserver (spawned where there is none, e.g.
+# Windows), not a fork of this multithreaded server, and only import
+# pdf_text. The pool starts with the first PDF.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Fewer pages than this per worker isn't worth the hand-off
+PDF_MIN_PAGES_PER_TASK = 8
+_pdf_pool: ProcessPoolExecutor | None = None
+
+def new_pdf_pool() -> ProcessPoolExecutor:
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("forkserver")
+        # Instead of the default of re-importing __main__ in the forkserver
+        mp_context.set_forkserver_preload(["pdf_text"])
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=mp_context)
+
+async def extract_text_from_pdf(data: bytes) -> str:
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = new_pdf_pool()
+    pool = _pdf_pool
+    loop = asyncio.get_running_loop()
+    try:
+        n_pages = await loop.run_in_executor(pool, count_pdf_pages, data)
+        step = max(PDF_MIN_PAGES_PER_TASK, -(-n_pages // PDF_WORKERS))
+        parts = await asyncio.gather(*[
+            loop.run_in_executor(pool, extract_pdf_pages, data, start, min(start + step, n_pages))
+            for start in range(0, n_pages, step)
+        ])
+    except PdfiumError:
+        # Malformed or encrypted file
+        raise HTTPException(status_code=400, detail="Could not read PDF.")
+    except BrokenProcessPool:
+        # A worker died inside PDFium; later uploads get a fresh pool
+        # (unless a concurrent upload already replaced it)
+        if _pdf_pool is pool:
+            _pdf_pool = new_pdf_pool()
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise HTTPException(status_code=400, detail="Could not read PDF.")
+    # gather keeps submission order, so pages come back in order
+    return "\n".join(page for part in parts for page in part).strip()
+
+def upload_to_supabase(upload: IO[bytes], file_path: str, content_type: str) -> str:
+    upload.seek(0)
+    documents_bucket.upload(
         path=file_path,
-        file=file_bytes,
+        file=upload.read(),
         file_options={"content-type": content_type}
     )
     return file_path
@@ -601,55 +754,131 @@ def upload_to_supabase(file_bytes: bytes, file_path: str, content_type: str) ->
 # FILE UPLOAD ENDPOINT
 # ─────────────────────────────────────────
 
-@app.post("/documents/upload", response_model=DocumentResponse, status_code=201)
+MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+UPLOAD_READ_SIZE = 64 * 1024
+# Uploads past this size are spooled to a temp file instead of RAM
+UPLOAD_SPOOL_SIZE = 1024 * 1024
+
+@app.post(
+    "/documents/upload",
+    response_model=DocumentResponse,
+    status_code=201,
+    responses={200: {"model": DocumentResponse, "description": "Same file already uploaded; the existing document"}}
+)
 async def upload_document(
+    background_tasks: BackgroundTasks,
+    response: Response,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     allowed_types = ["application/pdf", "text/plain"]
     if file.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="File type not allowed. Upload PDF or TXT files only.")
 
-    file_bytes = await file.read()
+    too_large = HTTPException(status_code=400, detail="File too large. Maximum size is 5MB.")
+    # The multipart parser already knows the size — reject before reading
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise too_large
+
+    # Read in pieces, enforcing the cap as we go, into a spool that
+    # holds at most UPLOAD_SPOOL_SIZE in memory; text is decoded piece
+    # by piece instead of decoding one big copy at the end.
+    # Stray non-UTF-8 bytes become U+FFFD rather than failing the upload.
+    is_pdf = file.content_type == "application/pdf"
+    decoder = None if is_pdf else codecs.getincrementaldecoder("utf-8")("replace")
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+    hasher = hashlib.blake2b(digest_size=32)
+    try:
+        text_parts, size = [], 0
+        while piece := await file.read(UPLOAD_READ_SIZE):
+            size += len(piece)
+            if size > MAX_UPLOAD_SIZE:
+                raise too_large
+            spool.write(piece)
+            hasher.update(piece)
+            if decoder:
+                text_parts.append(decoder.decode(piece))
+
+        # The same bytes uploaded again by this user: hand back that
+        # document (200, nothing was created) without extracting,
+        # inserting or storing anything
+        content_hash = hasher.hexdigest()
+        existing = await find_uploaded_document(current_user.id, content_hash, db)
+        if existing:
+            spool.close()
+            response.status_code = 200
+            return existing
+
+        if is_pdf:
+            spool.seek(0)
+            content = await extract_text_from_pdf(spool.read())
+            file_type = "pdf"
+            if not content:
+                raise HTTPException(status_code=400, detail="Could not extract text from PDF.")
+        else:
+            text_parts.append(decoder.decode(b"", final=True))
+            content = "".join(text_parts)
+            file_type = "txt"
 
-    max_size = 5 * 1024 * 1024
-    if len(file_bytes) > max_size:
-        raise HTTPException(status_code=400, detail="File too large. Maximum size is 5MB.")
+        storage_path = f"{current_user.id}/{uuid.uuid4()}/{file.filename}"
 
-    if file.content_type == "application/pdf":
-        content = extract_text_from_pdf(file_bytes)
-        file_type = "pdf"
-        if not content:
-            raise HTTPException(status_code=400, detail="Could not extract text from PDF.")
-    else:
-        content = file_bytes.decode("utf-8")
-        file_type = "txt"
+        try:
+            db_doc = (await db.execute(pg_insert(Document).values(
+                user_id=current_user.id,
+                title=file.filename,
+                content=content,
+                tags=[],
+                file_path=storage_path,
+                file_type=file_type,
+                content_hash=content_hash
+            ).on_conflict_do_nothing(
+                index_elements=[Document.user_id, Document.content_hash]
+            ).returning(Document))).scalar_one_or_none()
+            await db.commit()
+        except Exception as e:
+            print(f"DATABASE ERROR: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Database save failed: {str(e)}")
+
+        if db_doc is None:
+            # A concurrent upload of the same file got there first
+            spool.close()
+            response.status_code = 200
+            return await find_uploaded_document(current_user.id, content_hash, db)
+    except BaseException:
+        spool.close()
+        raise
+
+    # The text is already saved — the original file goes to Supabase
+    # Storage after the response, so the client doesn't wait on it.
+    # The background task owns the spool from here and closes it.
+    background_tasks.add_task(
+        store_uploaded_file, db_doc.id, spool, storage_path, file.content_type
+    )
+    return db_doc
 
-    storage_path = f"{current_user.id}/{uuid.uuid4()}/{file.filename}"
 
-    try:
-        upload_to_supabase(file_bytes, storage_path, file.content_type)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"File storage failed: {str(e)}")
+async def find_uploaded_document(user_id: str, content_hash: str, db: AsyncSession):
+    return (await db.execute(select(Document).where(
+        Document.user_id == user_id,
+        Document.content_hash == content_hash
+    ))).scalar_one_or_none()
+
 
+async def store_uploaded_file(doc_id: str, upload: IO[bytes], storage_path: str, content_type: str):
+    """Background task — on failure the document keeps its text but loses file_path."""
     try:
-        db_doc = Document(
-            id=str(uuid.uuid4()),
-            user_id=current_user.id,
-            title=file.filename,
-            content=content,
-            tags=[],
-            file_path=storage_path,
-            file_type=file_type
-        )
-        db.add(db_doc)
-        db.commit()
-        db.refresh(db_doc)
-        return db_doc
+        # The Supabase client is synchronous
+        await asyncio.to_thread(upload_to_supabase, upload, storage_path, content_type)
     except Exception as e:
-        print(f"DATABASE ERROR: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Database save failed: {str(e)}")
+        print(f"File storage failed for {doc_id}: {str(e)}")
+        async with SessionLocal() as db:
+            await db.execute(update(Document).where(Document.id == doc_id).values(
+                file_path=None
+            ))
+            await db.commit()
+    finally:
+        upload.close()
 
 
 # ─────────────────────────────────────────
@@ -659,60 +888,62 @@ async def upload_document(
 @app.post("/conversations", response_model=ConversationResponse, status_code=201)
 async def create_conversation(
     conv: ConversationCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     # Normalize — if document_id provided, include it in document_ids too
     doc_ids = list(conv.document_ids or [])
     if conv.document_id and conv.document_id not in doc_ids:
         doc_ids = [conv.document_id] + doc_ids
 
-    # Verify all documents belong to this user and are processed
-    for did in doc_ids:
-        doc = db.query(Document).filter(
-            Document.id == did,
+    # Verify all documents belong to this user and are processed (one query)
+    docs = {}
+    if doc_ids:
+        rows = await db.execute(select(Document.id, Document.title, Document.is_processed).where(
+            Document.id == any_(doc_ids),
             Document.user_id == current_user.id
-        ).first()
+        ))
+        docs = {row.id: row for row in rows}
+    for did in doc_ids:
+        doc = docs.get(did)
         if not doc:
             raise HTTPException(status_code=404, detail=f"Document {did} not found")
         if not doc.is_processed:
             raise HTTPException(status_code=400, detail=f"Document '{doc.title}' is not processed yet")
 
-    db_conv = Conversation(
-        id=str(uuid.uuid4()),
+    db_conv = (await db.execute(insert(Conversation).values(
         user_id=current_user.id,
         document_id=doc_ids[0] if doc_ids else None,
         document_ids=doc_ids,
         title=conv.title
-    )
-    db.add(db_conv)
-    db.commit()
-    db.refresh(db_conv)
+    ).returning(Conversation))).scalar_one()
+    await db.commit()
     return db_conv
 
 @app.get("/conversations", response_model=list[ConversationResponse])
 async def list_conversations(
     limit: int = 50,
     offset: int = 0,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    return db.query(Conversation).filter(
+    result = await db.execute(select(*response_columns(Conversation, ConversationResponse)).where(
         Conversation.user_id == current_user.id
     ).order_by(
         Conversation.updated_at.desc()
-    ).offset(offset).limit(limit).all()
+    ).offset(offset).limit(limit))
+    return construct_all(ConversationResponse, result)
 
 @app.get("/conversations/{conv_id}", response_model=ConversationResponse)
 async def get_conversation(
     conv_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    conv = db.query(Conversation).filter(
+    conv = (await db.execute(select(Conversation).where(
         Conversation.id == conv_id,
         Conversation.user_id == current_user.id
-    ).first()
+    ))).scalar_one_or_none()
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
     return conv
@@ -720,19 +951,17 @@ async def get_conversation(
 @app.delete("/conversations/{conv_id}")
 async def delete_conversation(
     conv_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    conv = db.query(Conversation).filter(
+    # Messages and share links cascade in the database
+    deleted = (await db.execute(delete(Conversation).where(
         Conversation.id == conv_id,
         Conversation.user_id == current_user.id
-    ).first()
-    if not conv:
+    ))).rowcount
+    if not deleted:
         raise HTTPException(status_code=404, detail="Conversation not found")
-
-    db.query(Message).filter(Message.conversation_id == conv_id).delete()
-    db.delete(conv)
-    db.commit()
+    await db.commit()
     return {"message": "Conversation and all messages deleted", "id": conv_id}
 
 
@@ -744,65 +973,63 @@ async def delete_conversation(
 async def add_message(
     conv_id: str,
     message: MessageCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    conv = db.query(Conversation).filter(
+    # Ownership check and updated_at bump in one statement
+    touched = (await db.execute(update(Conversation).where(
         Conversation.id == conv_id,
         Conversation.user_id == current_user.id
-    ).first()
-    if not conv:
+    ).values(updated_at=UTC_NOW).returning(Conversation.id))).first()
+    if not touched:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    db_message = Message(
-        id=str(uuid.uuid4()),
+    db_message = (await db.execute(insert(Message).values(
         conversation_id=conv_id,
         role="user",
         content=message.content
-    )
-    db.add(db_message)
-    conv.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_message)
+    ).returning(Message))).scalar_one()
+    await db.commit()
     return db_message
 
 @app.get("/conversations/{conv_id}/messages", response_model=list[MessageResponse])
 async def get_messages(
     conv_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    conv = db.query(Conversation).filter(
+    owned = await db.scalar(select(exists().where(
         Conversation.id == conv_id,
         Conversation.user_id == current_user.id
-    ).first()
-    if not conv:
+    )))
+    if not owned:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    return db.query(Message).filter(
+    result = await db.execute(select(*response_columns(Message, MessageResponse)).where(
         Message.conversation_id == conv_id
-    ).order_by(Message.created_at.asc()).all()
+    ).order_by(Message.created_at.asc()))
+    return construct_all(MessageResponse, result)
 
 @app.get("/conversations/{conv_id}/export")
 async def export_conversation(
     conv_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    conv = db.query(Conversation).filter(
+    title = await db.scalar(select(Conversation.title).where(
         Conversation.id == conv_id,
         Conversation.user_id == current_user.id
-    ).first()
-    if not conv:
+    ))
+    if title is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    messages = db.query(Message).filter(
+    messages = (await db.execute(select(Message.role, Message.content).where(
         Message.conversation_id == conv_id
-    ).order_by(Message.created_at.asc()).all()
+    ).order_by(Message.created_at.asc()))).all()
 
     # Build markdown
     lines = []
-    lines.append(f"# {conv.title}")
+    lines.append(f"# {title}")
     lines.append(f"*Exported from DocMind — {datetime.utcnow().strftime('%B %d, %Y')}*")
     lines.append("")
 
@@ -816,7 +1043,7 @@ async def export_conversation(
     markdown = "\n".join(lines)
 
     return {
-        "title": conv.title,
+        "title": title,
         "markdown": markdown,
         "message_count": len(messages)
     }
@@ -824,20 +1051,20 @@ async def export_conversation(
 @app.post("/conversations/{conv_id}/share")
 async def create_share_link(
     conv_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    conv = db.query(Conversation).filter(
+    owned = await db.scalar(select(exists().where(
         Conversation.id == conv_id,
         Conversation.user_id == current_user.id
-    ).first()
-    if not conv:
+    )))
+    if not owned:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
     # Return existing share link if one exists
-    existing = db.query(ShareLink).filter(
+    existing = (await db.execute(select(ShareLink).where(
         ShareLink.conversation_id == conv_id
-    ).first()
+    ))).scalars().first()
     if existing:
         frontend_url = os.getenv("FRONTEND_URL", "https://docmind-frontend-eight.vercel.app")
         return {
@@ -850,12 +1077,11 @@ async def create_share_link(
 
     token = secrets.token_urlsafe(24)
     share = ShareLink(
-        id=str(uuid.uuid4()),
         conversation_id=conv_id,
         token=token
     )
     db.add(share)
-    db.commit()
+    await db.commit()
 
     frontend_url = os.getenv("FRONTEND_URL", "https://docmind-frontend-eight.vercel.app")
     return {
@@ -870,41 +1096,41 @@ async def create_share_link(
 @app.delete("/conversations/{conv_id}/share")
 async def revoke_share_link(
     conv_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    conv = db.query(Conversation).filter(
+    owned = await db.scalar(select(exists().where(
         Conversation.id == conv_id,
         Conversation.user_id == current_user.id
-    ).first()
-    if not conv:
+    )))
+    if not owned:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    db.query(ShareLink).filter(
+    await db.execute(delete(ShareLink).where(
         ShareLink.conversation_id == conv_id
-    ).delete()
-    db.commit()
+    ))
+    await db.commit()
     return {"message": "Share link revoked"}
 
 
 @app.get("/share/{token}")
 async def get_shared_conversation(
     token: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    share = db.query(ShareLink).filter(
+    share = (await db.execute(select(ShareLink).where(
         ShareLink.token == token
-    ).first()
+    ))).scalar_one_or_none()
     if not share:
         raise HTTPException(status_code=404, detail="Share link not found or revoked")
 
-    conv = db.query(Conversation).filter(
+    conv = (await db.execute(select(Conversation.title, Conversation.created_at).where(
         Conversation.id == share.conversation_id
-    ).first()
+    ))).one()
 
-    messages = db.query(Message).filter(
+    messages = (await db.execute(select(Message.role, Message.content, Message.created_at).where(
         Message.conversation_id == share.conversation_id
-    ).order_by(Message.created_at.asc()).all()
+    ).order_by(Message.created_at.asc()))).all()
 
     return {
         "title": conv.title,
@@ -922,13 +1148,14 @@ async def get_shared_conversation(
 @app.post("/documents/{doc_id}/process")
 async def process_document_endpoint(
     doc_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    doc = db.query(Document).filter(
+    doc = (await db.execute(select(Document.content).where(
         Document.id == doc_id,
         Document.user_id == current_user.id
-    ).first()
+    ))).first()
 
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -936,44 +1163,69 @@ async def process_document_endpoint(
         raise HTTPException(status_code=400, detail="Document has no content to process")
 
     try:
-        chunk_count = process_document(
+        chunk_count = await process_document(
             document_id=doc_id,
             user_id=current_user.id,
             content=doc.content,
             db=db
         )
 
-        summary = generate_summary(doc.content)
-        print(f"Generated summary: {summary[:100] if summary else 'NONE'}")
+        # Commits the new chunks and the flag together
+        await db.execute(update(Document).where(Document.id == doc_id).values(
+            is_processed=True
+        ))
+        await db.commit()
 
-        doc.summary = summary
-        doc.is_processed = True
-        db.commit()
+        # The summary is a second LLM round-trip — don't make the
+        # response wait for it; it lands on the document when ready
+        background_tasks.add_task(save_document_summary, doc_id, doc.content)
 
         return {
             "message": "Document processed successfully",
             "document_id": doc_id,
             "chunks_created": chunk_count,
-            "summary": summary
+            "summary": None
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
 
-@app.post("/conversations/{conv_id}/chat", response_model=MessageResponse)
-async def chat(
-    conv_id: str,
-    message: MessageCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    import uuid as uuid_lib
-
-    conv = db.query(Conversation).filter(
-        Conversation.id == conv_id,
-        Conversation.user_id == current_user.id
-    ).first()
+async def save_document_summary(doc_id: str, content: str):
+    """Background task — the request's session is closed by the time this runs."""
+    try:
+        summary = await generate_summary(content)
+    except Exception as e:
+        print(f"Summary generation failed for {doc_id}: {e}")
+        return
+    print(f"Generated summary: {summary[:100] if summary else 'NONE'}")
+
+    async with SessionLocal() as db:
+        await db.execute(update(Document).where(Document.id == doc_id).values(
+            summary=summary
+        ))
+        await db.commit()
+
+
+async def get_chat_document_ids(conv_id: str, user_id: str, db: AsyncSession) -> list[str]:
+    """Linked document ids of a conversation, checked for ownership and processing in one query."""
+    # Multi-doc conversations use document_ids, single-doc ones document_id.
+    # The CASE picks the array, so the predicate stays an indexable
+    # `documents.id = ANY(...)` primary key lookup.
+    linked = Document.id == any_(case(
+        (func.cardinality(Conversation.document_ids) > 0, Conversation.document_ids),
+        else_=array([Conversation.document_id])
+    ))
+    processed_count = (
+        select(func.count())
+        .where(linked, Document.is_processed)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    conv = (await db.execute(
+        select(Conversation.document_id, Conversation.document_ids, processed_count.label("processed"))
+        .where(Conversation.id == conv_id, Conversation.user_id == user_id)
+    )).first()
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
@@ -981,26 +1233,27 @@ async def chat(
     doc_ids = conv.document_ids if conv.document_ids else ([conv.document_id] if conv.document_id else [])
     if not doc_ids:
         raise HTTPException(status_code=400, detail="Conversation has no linked documents.")
+    if conv.processed < len(set(doc_ids)):
+        raise HTTPException(status_code=400, detail="Document not processed yet.")
+    return doc_ids
 
-    for did in doc_ids:
-        d = db.query(Document).filter(Document.id == did).first()
-        if not d or not d.is_processed:
-            raise HTTPException(status_code=400, detail="Document not processed yet.")
 
-    # Save user message
-    user_message = Message(
-        id=str(uuid_lib.uuid4()),
-        conversation_id=conv_id,
-        role="user",
-        content=message.content
-    )
-    db.add(user_message)
-    db.commit()
+@app.post("/conversations/{conv_id}/chat", response_model=MessageResponse)
+async def chat(
+    conv_id: str,
+    message: MessageCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    # The lookup opens this request's transaction, so its now() marks
+    # when the question was asked; the user message is written
+    # together with the answer below
+    doc_ids = await get_chat_document_ids(conv_id, current_user.id, db)
 
     # Generate AI response — single or multi doc
     try:
         if len(doc_ids) == 1:
-            ai_response = generate_rag_response(
+            ai_response = await generate_rag_response(
                 question=message.content,
                 document_id=doc_ids[0],
                 user_id=current_user.id,
@@ -1008,16 +1261,16 @@ async def chat(
                 db=db
             )
         else:
-            chunks = find_relevant_chunks_multi(
+            chunks = await find_relevant_chunks_multi(
                 question=message.content,
                 user_id=current_user.id,
                 document_ids=doc_ids,
                 db=db
             )
             context = "\n\n---\n\n".join(chunks) if chunks else "No relevant context found."
-            history = get_conversation_history(conv_id, db)
+            history = await get_conversation_history(conv_id, db)
             messages_for_ai = build_messages(context, history, message.content)
-            response = client.chat.completions.create(
+            response = await aclient.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=messages_for_ai,
                 max_tokens=1000,
@@ -1028,66 +1281,55 @@ async def chat(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI response failed: {str(e)}")
 
-    # Save assistant message
-    assistant_message = Message(
-        id=str(uuid_lib.uuid4()),
-        conversation_id=conv_id,
-        role="assistant",
-        content=ai_response
-    )
-    db.add(assistant_message)
-    conv.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(assistant_message)
-    return assistant_message
+    # Save both messages and bump the conversation in a single
+    # transaction, stamped by the database clock: the question at the
+    # transaction's start, the answer (after it) at the wall clock now
+    saved = (await db.execute(insert(Message).values([
+        {"conversation_id": conv_id, "role": "user", "content": message.content, "created_at": UTC_NOW},
+        {"conversation_id": conv_id, "role": "assistant", "content": ai_response, "created_at": UTC_CLOCK},
+    ]).returning(Message.id, Message.role, Message.created_at))).all()
+    answer = next(row for row in saved if row.role == "assistant")
+    await db.execute(update(Conversation).where(Conversation.id == conv_id).values(
+        updated_at=answer.created_at
+    ))
+    await db.commit()
+    return {
+        "id": answer.id,
+        "conversation_id": conv_id,
+        "role": "assistant",
+        "content": ai_response,
+        "created_at": answer.created_at
+    }
 
 
 @app.post("/conversations/{conv_id}/chat/stream")
 async def chat_stream(
     conv_id: str,
     message: MessageCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    import uuid as uuid_lib
-
-    conv = db.query(Conversation).filter(
-        Conversation.id == conv_id,
-        Conversation.user_id == current_user.id
-    ).first()
-    if not conv:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-
-    # Support both single and multi-doc conversations
-    doc_ids = conv.document_ids if conv.document_ids else ([conv.document_id] if conv.document_id else [])
-    if not doc_ids:
-        raise HTTPException(status_code=400, detail="Conversation has no linked documents.")
-
-    for did in doc_ids:
-        d = db.query(Document).filter(Document.id == did).first()
-        if not d or not d.is_processed:
-            raise HTTPException(status_code=400, detail="Document not processed yet.")
+    doc_ids = await get_chat_document_ids(conv_id, current_user.id, db)
 
     # Save user message
     user_message = Message(
-        id=str(uuid_lib.uuid4()),
         conversation_id=conv_id,
         role="user",
         content=message.content
     )
     db.add(user_message)
-    db.commit()
+    await db.commit()
 
     # Get relevant chunks — single or multi doc
     if len(doc_ids) == 1:
-        chunks = find_relevant_chunks(
+        chunks = await find_relevant_chunks(
             question=message.content,
             document_id=doc_ids[0],
             user_id=current_user.id,
             db=db
         )
     else:
-        chunks = find_relevant_chunks_multi(
+        chunks = await find_relevant_chunks_multi(
             question=message.content,
             user_id=current_user.id,
             document_ids=doc_ids,
@@ -1095,36 +1337,23 @@ async def chat_stream(
         )
 
     context = "\n\n---\n\n".join(chunks) if chunks else "No relevant context found."
-    history = get_conversation_history(conv_id, db)
+    history = await get_conversation_history(conv_id, db)
     messages_for_ai = build_messages(context, history, message.content)
-    assistant_id = str(uuid_lib.uuid4())
+
+    # Hand the connection back before streaming: the answer can take a
+    # while, and saving it leases a connection of its own
+    await db.close()
 
     async def generate():
-        full_response = ""
+        response_parts = []
         try:
-            stream = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages_for_ai,
-                max_tokens=1000,
-                temperature=0.3,
-                stream=True,
-            )
-            for chunk in stream:
-                delta = chunk.choices[0].delta.content
-                if delta:
-                    full_response += delta
-                    yield f"data: {json.dumps({'content': delta})}\n\n"
-
-            # Save complete response after streaming finishes
-            assistant_message = Message(
-                id=assistant_id,
-                conversation_id=conv_id,
-                role="assistant",
-                content=full_response
-            )
-            db.add(assistant_message)
-            conv.updated_at = datetime.utcnow()
-            db.commit()
+            async for delta in stream_chat_completion(messages_for_ai):
+                response_parts.append(delta)
+                yield f"data: {json.dumps({'content': delta})}\n\n"
+            # Only a fully streamed answer is saved, and before `done`
+            # goes out, so a client reloading on `done` sees it. A client
+            # that disconnects cancels the generator before this point.
+            assistant_id = await save_streamed_message(conv_id, "".join(response_parts))
             yield f"data: {json.dumps({'done': True, 'id': assistant_id})}\n\n"
 
         except Exception as e:
@@ -1137,31 +1366,56 @@ async def chat_stream(
     )
 
 
-@app.get("/documents/{doc_id}/chunks")
+async def save_streamed_message(conv_id: str, content: str) -> str:
+    """Runs inside the stream — the request's session is closed by then. Returns the new id."""
+    async with SessionLocal() as db:
+        # The id comes from the gen_uuid_v7() server default
+        assistant_id = (await db.execute(insert(Message).values(
+            conversation_id=conv_id,
+            role="assistant",
+            content=content
+        ).returning(Message.id))).scalar_one()
+        await db.execute(update(Conversation).where(Conversation.id == conv_id).values(
+            updated_at=UTC_NOW
+        ))
+        await db.commit()
+    return assistant_id
+
+
+@app.get("/documents/{doc_id}/chunks", response_model=DocumentChunksResponse)
 async def get_document_chunks(
     doc_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    doc = db.query(Document).filter(
+    is_processed = await db.scalar(select(Document.is_processed).where(
         Document.id == doc_id,
         Document.user_id == current_user.id
-    ).first()
-    if not doc:
+    ))
+    if is_processed is None:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    chunks = db.query(DocumentChunk).filter(
+    # Only the first 200 characters leave Postgres, plus the length
+    # to know whether the preview was cut
+    chunks = (await db.execute(select(
+        DocumentChunk.chunk_index,
+        func.substr(ChunkBlob.content, 1, 200).label("preview"),
+        func.length(ChunkBlob.content).label("length")
+    ).join(
+        ChunkBlob, ChunkBlob.id == DocumentChunk.blob_id
+    ).where(
+        DocumentChunk.user_id == current_user.id,
         DocumentChunk.document_id == doc_id
-    ).order_by(DocumentChunk.chunk_index).all()
+    ).order_by(DocumentChunk.chunk_index))).all()
 
     return {
         "document_id": doc_id,
-        "is_processed": doc.is_processed,
+        "is_processed": is_processed,
         "chunk_count": len(chunks),
         "chunks": [
             {
                 "index": c.chunk_index,
-                "preview": c.content[:200] + "..." if len(c.content) > 200 else c.content
+                "preview": c.preview + "..." if c.length > 200 else c.preview
             }
             for c in chunks
         ]
@@ -1171,20 +1425,19 @@ async def get_document_chunks(
 async def update_tags(
     doc_id: str,
     payload: dict,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    doc = db.query(Document).filter(
+    tags = payload.get("tags", [])
+    # Normalize: lowercase, strip whitespace, remove duplicates
+    tags = list(set(t.strip().lower() for t in tags if t.strip()))
+
+    # Ownership check and write in one statement
+    updated = (await db.execute(update(Document).where(
         Document.id == doc_id,
         Document.user_id == current_user.id
-    ).first()
-    if not doc:
+    ).values(tags=tags, updated_at=UTC_NOW).returning(Document.id))).first()
+    if not updated:
         raise HTTPException(status_code=404, detail="Document not found")
-
-    tags = payload.get("tags", [])
-    # Normalize: lowercase, strip whitespace, remove duplicates
-    doc.tags = list(set(t.strip().lower() for t in tags if t.strip()))
-    doc.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(doc)
-    return {"id": doc_id, "tags": doc.tags}
\ No newline at end of file
+    await db.commit()
+    return {"id": doc_id, "tags": tags}
\ No newline at end of file
@@ -0,0 +1,44 @@
+"""
+FILE: pdf_text.py
+ROLE: PDF text extraction, run inside the PDF worker processes.
+
+WHAT THIS FILE DOES:
+- Counts the pages of a PDF
+- Extracts the text of a run of pages
+
+WHAT THIS FILE DOES NOT DO:
+- Does not start or manage the worker pool (that's main.py)
+- Imports nothing from the app — workers load only this module and
+  pypdfium2, not the OpenAI client, tiktoken or the database engine
+
+IMPORTS FROM:
+- pypdfium2 only
+"""
+
+import pypdfium2 as pdfium
+
+
+def count_pdf_pages(data: bytes) -> int:
+    pdf = pdfium.PdfDocument(data)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def extract_pdf_pages(data: bytes, start: int, stop: int) -> list[str]:
+    """Text of pages [start, stop), empty pages skipped."""
+    pages = []
+    pdf = pdfium.PdfDocument(data)
+    try:
+        for index in range(start, stop):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            page_text = textpage.get_text_range()
+            textpage.close()
+            page.close()
+            if page_text:
+                pages.append(page_text.replace("\r\n", "\n"))
+    finally:
+        pdf.close()
+    return pages
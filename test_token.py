@@ -1,4 +1,4 @@
-from jose import jwt
+import jwt
 from dotenv import load_dotenv
 import os
 